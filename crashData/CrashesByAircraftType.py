@@ -1,43 +1,303 @@
 #!/usr/bin/env python3
 
-from csv import DictReader, writer, QUOTE_NONNUMERIC
-from collections import Counter, namedtuple
+from argparse import ArgumentParser
+from csv import DictReader, Error as CsvError, writer, QUOTE_NONNUMERIC
+from collections import Counter, defaultdict, namedtuple
+from hashlib import sha1
+from heapq import nlargest
+from inspect import getgeneratorstate, GEN_CLOSED
+from os.path import getsize
+
+from checkpoint import Checkpoint
 
 TypeCrashes = namedtuple('TypeCrashes', ['type', 'crashes'])
 
-def getAircraftTypes():
-    with open('cleansedCrashData.csv', 'r') as csvFile:
-        reader = DictReader(csvFile)
-        for row in reader:
-            yield row['Type']
-            
-def writeSortedListToCSV(sortable, key, filename, reverse=False): 
-    sortedBy = sorted(sortable, key=key, reverse=reverse)
+# bytes before the watermark that must be unchanged to resume from it
+TAIL_BYTES = 1024
+
+
+def typeWords(aircraftType):
+    return [word for word in aircraftType.split(' ') if word]
+
+
+def manufacturerOf(row):
+    """the row's Manufacturer, or the first word of its Type until the
+    cleaner fills that in"""
+    manufacturer = row.get('Manufacturer', '').strip()
+    if manufacturer:
+        return manufacturer
+    words = typeWords(row['Type'])
+    return words[0] if words else ''
+
+
+def typeOf(row):
+    """the row's manufacturer and model, files cleaned before the cleaner
+    filled in Manufacturer have both in Type"""
+    manufacturer = row.get('Manufacturer', '').strip()
+    if manufacturer:
+        return manufacturer + ' ' + row['Type']
+    return row['Type']
+
+
+class CrashAggregates(object):
+    """Everything the reports need, gathered in one pass over the rows"""
+
+    def __init__(self):
+        self.crashesByType = Counter()
+        self.crashesByManufacturer = Counter()
+        self.crashesByOperator = Counter()
+        self.typesByManufacturer = defaultdict(set)
+        self.wordFrequencies = Counter()
+
+    def add(self, row):
+        aircraftType = typeOf(row)
+        manufacturer = manufacturerOf(row)
+        self.crashesByType[aircraftType] += 1
+        self.crashesByManufacturer[manufacturer] += 1
+        self.crashesByOperator[row.get('Operator', '')] += 1
+        self.typesByManufacturer[manufacturer].add(aircraftType)
+        self.wordFrequencies.update(typeWords(aircraftType))
+
+    def toState(self):
+        return {
+            'crashesByType': self.crashesByType,
+            'crashesByManufacturer': self.crashesByManufacturer,
+            'crashesByOperator': self.crashesByOperator,
+            'typesByManufacturer': {
+                manufacturer: sorted(types)
+                for manufacturer, types in self.typesByManufacturer.items()},
+            'wordFrequencies': self.wordFrequencies,
+        }
+
+    @classmethod
+    def fromState(cls, state):
+        aggregates = cls()
+        aggregates.crashesByType.update(state['crashesByType'])
+        aggregates.crashesByManufacturer.update(
+            state['crashesByManufacturer'])
+        aggregates.crashesByOperator.update(state['crashesByOperator'])
+        for manufacturer, types in state['typesByManufacturer'].items():
+            aggregates.typesByManufacturer[manufacturer].update(types)
+        aggregates.wordFrequencies.update(state['wordFrequencies'])
+        return aggregates
+
+    def addAll(self, rows):
+        for row in rows:
+            self.add(row)
+        return self
+
+    def typeCrashes(self):
+        return [
+            TypeCrashes(key, crashes)
+            for key, crashes in self.crashesByType.items()]
+
+    def topTypes(self, k):
+        """the k types with the most crashes, without sorting them all"""
+        return nlargest(k, self.typeCrashes(), key=lambda x: x.crashes)
+
+
+class Watermark(object):
+    """How far into the input the aggregates go: the byte offset just past
+    the last row added, the number of rows, the header, and a digest of
+    the TAIL_BYTES before the offset to tell an appended file from a
+    rewritten one"""
+
+    def __init__(self, offset=0, rows=0, fieldnames=None, tail=None):
+        self.offset = offset
+        self.rows = rows
+        self.fieldnames = fieldnames
+        self.tail = tail
+
+    def toState(self):
+        return dict(vars(self))
+
+    @classmethod
+    def fromState(cls, state):
+        return cls(**state)
+
+    @staticmethod
+    def tailDigest(csvFile, offset):
+        start = max(0, offset - TAIL_BYTES)
+        csvFile.seek(start)
+        return sha1(csvFile.read(offset - start)).hexdigest()
+
+    def matches(self, filename):
+        """True if filename still starts with the rows counted so far"""
+        if getsize(filename) < self.offset:
+            return False
+        with open(filename, 'rb') as csvFile:
+            return self.tailDigest(csvFile, self.offset) == self.tail
+
+
+def getRows(filename):
+    with open(filename, 'r', newline='') as csvFile:
+        yield from DictReader(csvFile)
+
+
+def completeLines(csvFile, consumed):
+    """Decodes the lines of csvFile, adding their lengths to consumed[0].
+    A last line without a newline is still being written and is left for
+    the next run."""
+    for line in csvFile:
+        if not line.endswith(b'\n'):
+            return
+        consumed[0] += len(line)
+        yield line.decode('utf-8')
+
+
+def foldRows(aggregates, filename, watermark):
+    """adds the rows of filename after the watermark to aggregates, moves
+    the watermark past them and returns how many there were"""
+    added = 0
+    with open(filename, 'rb') as csvFile:
+        csvFile.seek(watermark.offset)
+        consumed = [watermark.offset]
+        lines = completeLines(csvFile, consumed)
+        # strict, so a quoted field cut off by the end of the lines is an
+        # error rather than a row
+        reader = DictReader(
+            lines, fieldnames=watermark.fieldnames, strict=True)
+        try:
+            if watermark.fieldnames is None and reader.fieldnames is not None:
+                watermark.fieldnames = reader.fieldnames
+                watermark.offset = consumed[0]
+            for row in reader:
+                aggregates.add(row)
+                added += 1
+                watermark.offset = consumed[0]
+        except CsvError:
+            # past the complete lines the rest of the row hasn't been
+            # written yet, before them the row is malformed
+            if getgeneratorstate(lines) != GEN_CLOSED:
+                raise
+        watermark.rows += added
+        watermark.tail = Watermark.tailDigest(csvFile, watermark.offset)
+    return added
+
+
+def aggregate(filename, statePath=None):
+    """Returns the aggregates of filename.  With statePath, they are saved
+    there along with a watermark, and the next call only reads the rows
+    appended since.  If the file was rewritten rather than appended to,
+    everything is read again.  Only then is a last row without a newline
+    left for the next call."""
+    if statePath is None:
+        return CrashAggregates().addAll(getRows(filename))
+
+    aggregates = CrashAggregates()
+    watermark = Watermark()
+    checkpoint = Checkpoint(statePath)
+    if checkpoint.load():
+        saved = Watermark.fromState(checkpoint.state['watermark'])
+        if saved.matches(filename):
+            aggregates = CrashAggregates.fromState(
+                checkpoint.state['aggregates'])
+            watermark = saved
+
+    foldRows(aggregates, filename, watermark)
+    checkpoint.save(
+        aggregates=aggregates.toState(),
+        watermark=watermark.toState())
+    return aggregates
+
+
+def writeRowsToCSV(header, rows, filename):
     with open(filename, 'w') as outCsv:
         csvWriter = writer(outCsv, quoting=QUOTE_NONNUMERIC)
-        csvWriter.writerow(['type', 'crashes'])
-        for row in sortedBy:
-            csvWriter.writerow(row)
-            
-def main():
-    
-    crashesByType = Counter(getAircraftTypes())
-    
-    sortable = [TypeCrashes(key, crashesByType[key]) for key in crashesByType]
-    
+        csvWriter.writerow(header)
+        csvWriter.writerows(rows)
+
+
+def writeSortedListToCSV(sortable, key, filename, reverse=False):
+    writeRowsToCSV(
+        ['type', 'crashes'],
+        sorted(sortable, key=key, reverse=reverse),
+        filename)
+
+
+def writeTypesByNumberOfCrashes(aggregates, args):
     writeSortedListToCSV(
-        sortable, 
+        aggregates.typeCrashes(),
         lambda x: x.crashes,
         'TypesByNumberOfCrashes.csv',
         True)
-    
+
+
+def writeTypesAlphabetically(aggregates, args):
     writeSortedListToCSV(
-        sortable,
+        aggregates.typeCrashes(),
         lambda x: x.type,
         'TypesAlphabetically.csv')
 
-    
-                                                                 
+
+def writeTopTypes(aggregates, args):
+    writeRowsToCSV(
+        ['type', 'crashes'],
+        aggregates.topTypes(args.top),
+        'TopTypes.csv')
+
+
+def writeManufacturers(aggregates, args):
+    writeRowsToCSV(
+        ['manufacturer', 'crashes', 'types'],
+        sorted(
+            (
+                (manufacturer, crashes,
+                    len(aggregates.typesByManufacturer[manufacturer]))
+                for manufacturer, crashes
+                in aggregates.crashesByManufacturer.items()
+            ),
+            key=lambda x: x[1],
+            reverse=True),
+        'CrashesByManufacturer.csv')
+
+
+def writeOperators(aggregates, args):
+    writeRowsToCSV(
+        ['operator', 'crashes'],
+        aggregates.crashesByOperator.most_common(),
+        'CrashesByOperator.csv')
+
+
+def writeWordFrequencies(aggregates, args):
+    writeRowsToCSV(
+        ['word', 'frequency'],
+        aggregates.wordFrequencies.most_common(),
+        'TypeWordFrequencies.csv')
+
+
+# every report is written from the one pass over the input
+REPORTS = [
+    writeTypesByNumberOfCrashes,
+    writeTypesAlphabetically,
+    writeTopTypes,
+    writeManufacturers,
+    writeOperators,
+    writeWordFrequencies,
+]
+
+
+def main(args):
+    aggregates = aggregate(args.input_file, args.incremental)
+    for writeReport in REPORTS:
+        writeReport(aggregates, args)
+
 
 if __name__ == '__main__':
-    main()
+    parser = ArgumentParser(description='Crash reports by aircraft type')
+    parser.add_argument(
+        '-k', '--top',
+        type=int,
+        default=20,
+        help="number of types in TopTypes.csv")
+    parser.add_argument(
+        '-i', '--incremental',
+        metavar='STATE',
+        help="keep the aggregates in the file STATE and only read the rows "
+            "appended since the last run")
+    parser.add_argument(
+        'input_file',
+        nargs='?',
+        default='cleansedCrashData.csv',
+        help="cleansed crash data")
+    main(parser.parse_args())
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+"""Benchmarks each stage of the crash data spellcheck pipeline over
+crashData.csv and synthetic copies of it scaled up by repeating its rows.
+Results (throughput, latency percentiles and peak traced memory) are written
+as JSON so runs can be compared with --compare."""
+
+from argparse import ArgumentParser
+from contextlib import closing, redirect_stdout
+from csv import DictReader, DictWriter
+from datetime import datetime
+from json import dump, load
+from os import devnull
+from os.path import join
+from platform import python_version
+from random import Random
+from shutil import copyfile
+from sys import stdout
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import get_traced_memory, start, stop
+
+from cleanCrashData import CrashDataCleaner
+from dictionary import CachedDictionary, Dictionary
+from spellcheck import delete_generator, inserts_generator, \
+    replace_generator, SpellChecker, split_generator, transpose_generator
+from tokenizer import FastTokenizer, Tokenizer
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))
+    return sorted_samples[index]
+
+
+def summarize(latencies, items):
+    """items is the number of things (bytes, words, rows...) processed"""
+    total = sum(latencies)
+    latencies = sorted(latencies)
+    return {
+        'calls': len(latencies),
+        'items': items,
+        'seconds': round(total, 6),
+        'items_per_second': round(items / total, 1) if total else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 4),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 4),
+    }
+
+
+def time_calls(function, inputs):
+    latencies = []
+    for value in inputs:
+        started = perf_counter()
+        function(value)
+        latencies.append(perf_counter() - started)
+    return latencies
+
+
+def peak_memory(function, inputs):
+    """peak memory traced while calling function on each of inputs"""
+    start()
+    try:
+        for value in inputs:
+            function(value)
+        return get_traced_memory()[1]
+    finally:
+        stop()
+
+
+def measure(function, inputs, items):
+    result = summarize(time_calls(function, inputs), items)
+    result['peak_bytes'] = peak_memory(function, inputs)
+    return result
+
+
+def scale_csv(input_filepath, output_filepath, scale):
+    """writes input_filepath's rows scale times over"""
+    with open(input_filepath, 'r', newline='') as csv_in:
+        reader = DictReader(csv_in)
+        rows = list(reader)
+        fieldnames = reader.fieldnames
+    with open(output_filepath, 'w', newline='') as csv_out:
+        writer = DictWriter(csv_out, fieldnames=fieldnames)
+        writer.writeheader()
+        for _ in range(scale):
+            writer.writerows(rows)
+
+
+def misspell(word, random):
+    """swaps two neighbouring characters or drops one"""
+    i = random.randrange(len(word) - 1)
+    if random.random() < 0.5:
+        return word[:i] + word[i+1] + word[i] + word[i+2:]
+    return word[:i] + word[i+1:]
+
+
+class Benchmark(object):
+
+    def __init__(self, csv_path, dictionary_path, work_dir, sample_size=200):
+        self.csv_path = csv_path
+        self.dictionary_path = dictionary_path
+        self.work_dir = work_dir
+        self.sample_size = sample_size
+
+        with open(csv_path, 'r', newline='') as csv_in:
+            rows = list(DictReader(csv_in))
+        self.types = [row['Type'] for row in rows]
+        self.summaries = [row['Summary'] for row in rows]
+
+        tokenizer = FastTokenizer(hyphen_continues_word=True)
+        words = sorted({
+            token
+            for aircraft_type in self.types
+            for token in tokenizer.tokenize(aircraft_type)
+            if token.isalpha() and len(token) > 2})
+        random = Random(0)
+        self.words = random.sample(words, min(sample_size, len(words)))
+        self.misspelled = [misspell(word, random) for word in self.words]
+
+    def dictionary_copy(self, name):
+        path = join(self.work_dir, name)
+        copyfile(self.dictionary_path, path)
+        return path
+
+    def bench_tokenize(self, scale):
+        results = {}
+        texts = {
+            'Type': self.types * scale,
+            'Summary': self.summaries * scale,
+        }
+        for tokenizer in (Tokenizer(True), FastTokenizer(True)):
+            for field, field_texts in texts.items():
+                name = '{}.{}'.format(type(tokenizer).__name__, field)
+                results[name] = measure(
+                    lambda text: list(tokenizer.tokenize(text)),
+                    field_texts,
+                    sum(len(text) for text in field_texts))
+        return results
+
+    def bench_generators(self, scale):
+        words = self.words * scale
+        alphabet = set(SpellChecker.default_alphabet)
+        generators = {
+            'inserts': lambda word: inserts_generator(word, alphabet),
+            'splits': split_generator,
+            'deletes': delete_generator,
+            'transposes': transpose_generator,
+            'replaces': lambda word: replace_generator(word, alphabet),
+        }
+        results = {}
+        for name, generator in generators.items():
+            candidates = sum(1 for word in words for _ in generator(word))
+            results[name] = measure(
+                lambda word: list(generator(word)),
+                words,
+                candidates)
+        return results
+
+    def bench_find_candidates(self, scale):
+        words = self.misspelled * scale
+        results = {}
+        for delete_index in (False, True):
+            dictionary = CachedDictionary(
+                self.dictionary_copy('find_candidates.sqlite'),
+                delete_index=delete_index)
+            # closed before the next copy overwrites its file
+            with closing(dictionary.conn), dictionary:
+                spellchecker = SpellChecker(dictionary)
+                name = 'delete_index' if delete_index else 'generators'
+                results[name] = measure(
+                    lambda word: list(spellchecker.find_candidates(word)),
+                    words,
+                    len(words))
+        return results
+
+    def bench_dictionary(self, scale):
+        words = (self.words + self.misspelled) * scale
+        results = {}
+        for cls in (Dictionary, CachedDictionary):
+            dictionary = cls(self.dictionary_copy('lookups.sqlite'))
+            with closing(dictionary.conn), dictionary:
+                name = cls.__name__
+                results[name + '.contains'] = measure(
+                    lambda word: word in dictionary, words, len(words))
+                results[name + '.lookup_many'] = measure(
+                    dictionary.lookup_many, [words], len(words))
+                results[name + '.add_occurance'] = measure(
+                    dictionary.add_occurance, words, len(words))
+                dictionary.flush()
+        return results
+
+    def bench_run(self, scale):
+        csv_path = join(self.work_dir, 'crashData{}x.csv'.format(scale))
+        scale_csv(self.csv_path, csv_path, scale)
+        output_path = join(self.work_dir, 'cleansedCrashData.csv')
+
+        def clean(dedupe):
+            dictionary = CachedDictionary(
+                self.dictionary_copy('run.sqlite'),
+                delete_index=True)
+            cleaner = CrashDataCleaner(SpellChecker(dictionary))
+            with closing(dictionary.conn), dictionary:
+                cleaner.run(csv_path, output_path, dedupe=dedupe)
+
+        rows = len(self.types) * scale
+        results = {}
+        for dedupe in (False, True):
+            name = 'dedupe' if dedupe else 'rows'
+            results[name] = measure(clean, [dedupe], rows)
+        return results
+
+    STAGES = ['tokenize', 'generators', 'find_candidates', 'dictionary', 'run']
+
+    def run(self, scales, stages=STAGES):
+        results = {}
+        for stage in stages:
+            bench = getattr(self, 'bench_' + stage)
+            results[stage] = {}
+            for scale in scales:
+                with open(devnull, 'w') as quiet, redirect_stdout(quiet):
+                    results[stage]['{}x'.format(scale)] = bench(scale)
+        return results
+
+
+def compare(results, baseline, out_file=stdout):
+    """writes the throughput of results relative to baseline"""
+    for stage, scales in results.items():
+        for scale, measurements in scales.items():
+            for name, result in measurements.items():
+                try:
+                    before = baseline[stage][scale][name]['items_per_second']
+                except KeyError:
+                    continue
+                after = result['items_per_second']
+                if not before or not after:
+                    continue
+                out_file.write('{:<16} {:>5} {:<32} {:>7.2f}x\n'.format(
+                    stage, scale, name, after / before))
+
+
+def main(args):
+    scales = [int(scale) for scale in args.scales.split(',')]
+    stages = args.stages.split(',') if args.stages else Benchmark.STAGES
+    with TemporaryDirectory() as work_dir:
+        benchmark = Benchmark(
+            args.input_file,
+            args.dictionary,
+            work_dir,
+            args.sample_size)
+        results = benchmark.run(scales, stages)
+
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': python_version(),
+            'input_file': args.input_file,
+            'scales': scales,
+            'sample_size': args.sample_size,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as out_file:
+        dump(report, out_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = load(baseline_file)
+        compare(results, baseline['results'])
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Benchmark the crash data spellcheck pipeline')
+    parser.add_argument(
+        '-s', '--scales',
+        default='1,10,100',
+        help="comma separated list of how many times to repeat the data")
+    parser.add_argument(
+        '--stages',
+        help="comma separated subset of {}".format(
+            ','.join(Benchmark.STAGES)))
+    parser.add_argument(
+        '-n', '--sample-size',
+        type=int,
+        default=200,
+        help="distinct words used by the word level stages")
+    parser.add_argument(
+        '-d', '--dictionary',
+        default='aircraft.sqlite',
+        help="dictionary to benchmark against, it is copied, not modified")
+    parser.add_argument(
+        '-o', '--output',
+        default='benchmark.json',
+        help="file to write the results to")
+    parser.add_argument(
+        '-c', '--compare',
+        help="earlier results to compare throughput with")
+    parser.add_argument(
+        'input_file',
+        nargs='?',
+        default='crashData.csv',
+        help="crash data to benchmark with")
+    main(parser.parse_args())
@@ -0,0 +1,90 @@
+from re import compile as re_compile, escape
+
+from trie import Trie
+
+
+# category -> words or phrases in a summary that put a crash in it.  A
+# keyword only matches whole words, so its plural and other forms are
+# listed too.
+CATEGORIES = {
+    'collision': (
+        'collision', 'collisions', 'collided', 'colliding', 'mid-air',
+        'midair'),
+    'fire': (
+        'fire', 'fires', 'fireball', 'flames', 'burned', 'burning',
+        'burnt'),
+    'explosion': ('explosion', 'explosions', 'exploded', 'bombing'),
+    'weather': (
+        'weather', 'storm', 'storms', 'stormy', 'thunderstorm',
+        'thunderstorms', 'snowstorm', 'snowstorms', 'rainstorm',
+        'rainstorms', 'fog', 'foggy', 'fogbound', 'icing', 'ice', 'iced',
+        'turbulence', 'wind shear', 'windshear', 'snow', 'snowy', 'rain',
+        'rains', 'rainy', 'raining', 'lightning', 'visibility'),
+    'shot down': (
+        'shot down', 'anti-aircraft', 'missile', 'missiles', 'gunfire'),
+    'hijacking': (
+        'hijack', 'hijacked', 'hijacker', 'hijackers', 'hijacking'),
+    'fuel exhaustion': (
+        'fuel exhaustion', 'ran out of fuel', 'out of fuel',
+        'fuel starvation'),
+    'engine failure': (
+        'engine failure', 'engine failures', 'engine failed',
+        'engines failed', 'lost power', 'loss of power',
+        'loss of engine power'),
+    'terrain': (
+        'terrain', 'mountain', 'mountains', 'mountainous', 'mountainside',
+        'mountainsides', 'mountaintop', 'hillside', 'hillsides'),
+}
+
+
+def trie_pattern(node):
+    """Returns a regex matching the words below a Trie node.  Words with a
+    common prefix share one branch, so the regex engine tries each
+    character once instead of once per word, and a longer word is
+    preferred to a word it starts with."""
+    branches = [
+        escape(c) + trie_pattern(child)
+        for c, child in sorted(node.items())
+        if c != Trie.END]
+    if not branches:
+        return ''
+    if len(branches) == 1 and Trie.END not in node:
+        return branches[0]
+    pattern = '(?:{})'.format('|'.join(branches))
+    if Trie.END in node:
+        pattern += '?'
+    return pattern
+
+
+class SummaryTagger(object):
+    """Tags a summary with every category one of whose keywords it
+    contains.  The keywords of all the categories are compiled into one
+    regex, shaped like a trie of the keywords, so a summary is scanned
+    once however many categories and keywords there are."""
+
+    # joins the categories of a row in its category field
+    SEPARATOR = ';'
+
+    def __init__(self, categories=CATEGORIES):
+        self.names = list(categories)
+        # keyword -> index of its category in names
+        self.categories = {}
+        for i, keywords in enumerate(categories.values()):
+            for keyword in keywords:
+                self.categories.setdefault(keyword.lower(), i)
+        trie = Trie(self.categories)
+        self.regex = re_compile(r'\b' + trie_pattern(trie.root) + r'\b')
+
+    def tags(self, summary):
+        """returns the categories of summary, in the order they are
+        defined"""
+        found = set()
+        for match in self.regex.finditer(summary.lower()):
+            found.add(self.categories[match.group()])
+            if len(found) == len(self.names):
+                break
+        return [self.names[i] for i in sorted(found)]
+
+    def category(self, summary):
+        """returns the value of the category field for summary"""
+        return self.SEPARATOR.join(self.tags(summary))
@@ -0,0 +1,47 @@
+from hashlib import sha1
+from json import dump, load
+from os import fsync, remove, replace
+from os.path import exists
+
+# bytes before an offset that must be unchanged to resume from it
+TAIL_BYTES = 1024
+
+
+def tail_digest(path, offset):
+    """digest of the TAIL_BYTES of the file at path before offset, to tell
+    whether a run can resume reading it there"""
+    start = max(0, offset - TAIL_BYTES)
+    with open(path, 'rb') as input_file:
+        input_file.seek(start)
+        return sha1(input_file.read(offset - start)).hexdigest()
+
+
+class Checkpoint(object):
+    """A JSON file recording how far a long run got.  The file is replaced
+    atomically, so a crash leaves either the previous or the new state."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+
+    def load(self):
+        """reads the saved state, returns False if there is none"""
+        if not exists(self.path):
+            return False
+        with open(self.path, 'r') as checkpoint_file:
+            self.state = load(checkpoint_file)
+        return True
+
+    def save(self, **state):
+        self.state = state
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as checkpoint_file:
+            dump(state, checkpoint_file)
+            checkpoint_file.flush()
+            fsync(checkpoint_file.fileno())
+        replace(temp_path, self.path)
+
+    def remove(self):
+        if exists(self.path):
+            remove(self.path)
+        self.state = {}
@@ -1,21 +1,180 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentParser
-from collections import Counter
-from csv import DictReader, DictWriter
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from csv import DictReader, DictWriter, reader as csv_reader
+from itertools import chain, islice
+from os import fsync
+from os.path import exists, getsize
 from re import compile as re_compile
 from string import ascii_letters
 from sys import stderr
 
-from nltk import word_tokenize
-
-from spellcheck import contains_digits, Dictionary, SpellChecker
+from categories import SummaryTagger
+from checkpoint import Checkpoint, tail_digest
+from compactdict import compile_dictionary, CompactDictionary
+from dictionary import CachedDictionary, SharedDictionary
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from spellcheck import contains_digits, SpellChecker
 from subsequence_group import subsequence_group
-from tokenizer import Tokenizer
+from tokenizer import FastTokenizer
+from trie import Trie
+
+
+def chunks(iterable, size):
+    """yields lists of up to size items from iterable"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Set up in each worker process of CrashDataCleaner.clean_parallel
+worker_cleaner = None
+
+
+def init_worker(
+        db_file,
+        delete_index,
+        trie,
+        confidence_threshold,
+        max_distance,
+        lookups,
+        compact_path=None,
+        shared=False,
+        manufacturers=()):
+    """Gives the worker a cleaner over a private snapshot of the dictionary,
+    over the compiled dictionary at compact_path, which the workers share
+    through the page cache, or, if shared, over the dictionary file itself so
+    the occurances the worker counts are kept."""
+    global worker_cleaner
+    if compact_path is not None:
+        # compiled dictionaries have no delete index, the candidates are
+        # generated and pruned with prefixes searched in the mapped words
+        dictionary = CompactDictionary(compact_path)
+    elif shared:
+        dictionary = SharedDictionary(db_file, delete_index=delete_index)
+    else:
+        dictionary = CachedDictionary(
+            db_file,
+            delete_index=delete_index,
+            snapshot=True)
+    if trie:
+        dictionary.build_trie()
+    spellchecker = SpellChecker(
+        dictionary,
+        interactive=False,
+        confidence_threshold=confidence_threshold,
+        max_distance=max_distance)
+    worker_cleaner = CrashDataCleaner(
+        spellchecker,
+        classifier=ModelNumberClassifier(manufacturers))
+    worker_cleaner.lookups = lookups
+
+
+def clean_chunk(rows):
+    """returns the cleaned rows and the words the worker couldn't correct in
+    them"""
+    words_not_found = worker_cleaner.spellchecker.words_not_found
+    before = words_not_found.copy()
+    rows = [worker_cleaner.clean(row) for row in rows]
+    # the pool has no hook at worker exit, so write what was counted now
+    worker_cleaner.spellchecker.dictionary.flush()
+    return rows, words_not_found - before
+
+
+# manufacturers known before any are added to the dictionary, the first
+# spelling of a name is the one written out
+KNOWN_MANUFACTURERS = (
+    'Aero Commander', 'Aerospatiale', 'Airbus', 'Airspeed',
+    'Antonov', 'Armstrong Whitworth', 'Avia', 'Avro', 'BAC', 'BAe',
+    'Beech', 'Beechcraft', 'Bell', 'Blackburn', 'Bleriot', 'Boeing',
+    'Breguet', 'Bristol', 'British Aerospace', 'Britten-Norman', 'CAMS',
+    'Canadair', 'CASA', 'Caudron', 'Cessna', 'Consolidated', 'Convair',
+    'Curtiss', 'Curtiss-Wright', 'Dassault', 'de Havilland',
+    'de Havilland Canada', 'Dewoitine', 'Dornier', 'Douglas', 'Embraer',
+    'Eurocopter', 'Fairchild', 'Fairchild-Hiller', 'Farman',
+    'Focke-Wulf', 'Fokker', 'Ford', 'Gates Learjet', 'Grumman',
+    'Handley Page', 'Harbin', 'Hawker Siddeley', 'Heinkel', 'Hughes',
+    'Ilyushin', 'Junkers', 'Latecoere', 'Learjet', 'Let', 'Lisunov',
+    'Lockheed', 'Martin', 'McDonnell Douglas', 'Messerschmitt', 'Mil',
+    'Mitsubishi', 'NAMC', 'Nord', 'Northrop', 'Pilatus', 'Piper',
+    'Potez', 'Rockwell', 'Saab', 'Savoia-Marchetti', 'Short', 'Shorts',
+    'Sikorsky', 'Stinson', 'Sud Aviation', 'Sud-Aviation', 'Swearingen',
+    'Transall', 'Tupolev', 'Vickers', 'Yakovlev', 'Zeppelin',
+)
 
 
 class ModelNumberClassifier(object):
-    pass
+    """Splits an aircraft type into manufacturer, model and variant.  The
+    manufacturer is the longest known name the type starts with, found in
+    one walk of a trie of the lowercased names.  The model is the rest of
+    the type, with the variant taken off the end of its model number if
+    nothing follows it, or failing that, a trailing number after the
+    model's name."""
+
+    # letters and digits of a model number, then its variant:
+    # DC-6B, C-47A-DL, 707-351C, PA-31-350, SA.227AC, and letters after
+    # bare digits: 4-AT-B
+    MODEL_NUMBER_REGEX = re_compile(
+        r'(?P<model>\d+-[A-Za-z]+(?=-)|(?:[A-Za-z]+[-.]?)?\d+)'
+        r'-?(?P<variant>[-A-Za-z0-9]*)')
+
+    # Twin Otter 200, Metro II
+    TRAILING_VARIANT_REGEX = re_compile(r'\d+[A-Za-z]*|[IVX]+')
+
+    def __init__(self, manufacturers=()):
+        # lowercased name -> name as it is written out
+        self.names = {}
+        self.trie = Trie()
+        for name in manufacturers:
+            self.add(name)
+
+    @classmethod
+    def from_dictionary(cls, dictionary):
+        return cls(chain(
+            KNOWN_MANUFACTURERS,
+            dictionary.all_manufacturers()))
+
+    def add(self, name):
+        key = name.lower()
+        if self.trie.add(key):
+            self.names[key] = name
+
+    def manufacturers(self):
+        return list(self.names.values())
+
+    def classify(self, aircraft_type):
+        """returns the manufacturer, model and variant of aircraft_type, the
+        manufacturer is empty if it isn't known"""
+        key = self.trie.longest_prefix(aircraft_type.lower())
+        if key is None:
+            manufacturer = ''
+            words = aircraft_type.split()
+        else:
+            manufacturer = self.names[key]
+            words = aircraft_type[len(key):].split()
+        if not words:
+            return manufacturer, '', ''
+
+        variant = ''
+        # with more words of the name after it, the model number is kept
+        # whole: 32-2 Liberator
+        match = None
+        if len(words) == 1:
+            match = self.MODEL_NUMBER_REGEX.fullmatch(words[0])
+        if match is not None:
+            words[0] = match.group('model')
+            variant = match.group('variant')
+        # a type naming two aircraft has no variant of its own
+        if not variant and len(words) > 1 and '/' not in words \
+                and self.TRAILING_VARIANT_REGEX.fullmatch(words[-1]):
+            variant = words.pop()
+        return manufacturer, ' '.join(words), variant
+
 
 class CrashDataCleaner(object):
 
@@ -23,133 +182,443 @@ class CrashDataCleaner(object):
         'Military', 'Operator', 'Manufacturer', 'Type', 'Variant',
         'category', 'Aboard', 'Fatalities', 'Ground', 'Route', 'Summary']
 
+    OUTPUT_FIELDS = FIELD_ORDER + ['Registration', 'Flight #', 'cn/In']
+
+    MILITARY_PREFIX = 'Military - '
+    AIRSHIP_SUFFIX = ' (airship)'
+
     digit_regex = re_compile(r'\d')
 
+    # a row is a collision if its Type names two aircraft and its Summary
+    # is tagged with this category
+    COLLISION_CATEGORY = 'collision'
+
+    # fills the category field, built once for every cleaner
+    tagger = SummaryTagger()
+
+    # fields naming each aircraft of a collision, separated by '/'
+    COLLISION_SPLIT_FIELDS = ('Operator', 'Type', 'Registration')
+
+    # totals for both aircraft of a collision, kept on the first row only so
+    # summing a field counts them once
+    COLLISION_TOTAL_FIELDS = ('Aboard', 'Fatalities', 'Ground')
+
+    # fields whose distinct values dedupe() spellchecks ahead of the rows
+    DEDUPE_FIELDS = ('Type',)
+
     def __init__(
             self, 
-            spellchecker):
+            spellchecker,
+            instrumentation=NULL_INSTRUMENTATION,
+            classifier=None):
+        """Without a classifier, one is made from the manufacturers in the
+        spellchecker's dictionary"""
+        if classifier is None:
+            classifier = ModelNumberClassifier.from_dictionary(
+                spellchecker.dictionary)
+        self.classifier = classifier
         self.row_counter = 0
+        self.instrumentation = instrumentation
+        self.verbose = False
+        # field -> {raw value: (cleaned value, occurances counted, words not
+        # found)}, filled in by dedupe()
+        self.lookups = {}
+        self.input_offset = 0
         self.spellchecker = spellchecker
-        self.tokenizer = Tokenizer(hyphen_continues_word=True)
+        self.tokenizer = FastTokenizer(hyphen_continues_word=True)
                                                                      
-    @staticmethod
-    def is_collision(row):
-        summary = row.get('Summary', '').lower()
-        if '/' not in row.get('Type', ''):
-            return False
-        if 'collision' in summary:
-            return True
-        if 'mid-air' in summary:
-            return True
-        return False
+    @classmethod
+    def is_collision(cls, row, categories):
+        """True if the row, tagged with categories, is for two aircraft that
+        collided"""
+        return '/' in row.get('Type', '') \
+            and cls.COLLISION_CATEGORY in categories
 
     def split_collision_rows(self, row_generator):
-        """Determines if the Row is for a collision and splits the row in two"""
+        """Yields the rows with their category filled in from the Summary,
+        and each collision split into a row for each aircraft"""
+        separator = self.tagger.SEPARATOR
         for row in row_generator:
-            if self.is_collision(row):
+            categories = self.tagger.tags(row.get('Summary', ''))
+            row = dict(row, category=separator.join(categories))
+            if self.is_collision(row, categories):
+                yield from self.split_collision_row(row)
+            else:
                 yield row
-                yield self.split_collision_row(row)                           
-            yield row
 
     @staticmethod
     def split_value(value):
+        """returns the two halves of a value with one '/', or the value
+        twice if it doesn't name the two aircraft apart"""
         pieces = value.split('/')
-        pieces_length = len(pieces)
-        if pieces_length == 1:
-            return value, value
-        if pieces_length == 2:
-            return pieces[0], pieces[1]
-        
-                    
-            
-            
-            return value, value
-        if str(value).count('/') == 1:
-            pieces = value.split('/')
-            
+        if len(pieces) == 2:
+            return pieces[0].strip(), pieces[1].strip()
         return value, value
 
     def split_collision_row(self, row_in):
-        
-        type1, type2 = self.split_value(row_in['Type'])
-        operator1, operator2 = self.split_value(row_in['Operator'])
-        
-        new_row_number = self.next_row_number() 
-        new_row = {
-            'Number': new_row_number,
-            'summary': row_in['Summary'],
-            'Type': type2,
-            'Operator': operator2,
-            'CollisionWith': row_in['Number']
-        
-        }
-        
-        row_in['Type'] = type1
-        row_in['Operator'] = type2
-        row_in['CollisionWith'] = new_row_number
-        return new_row
+        """returns copies of a collision row for the first and the second
+        aircraft, each pointing at the other in collisionWith, with the
+        totals on the first"""
+        first = dict(row_in)
+        second = dict(row_in)
+        second['Number'] = self.next_row_number()
+        for field in self.COLLISION_SPLIT_FIELDS:
+            first[field], second[field] = self.split_value(
+                row_in.get(field, ''))
+        for field in self.COLLISION_TOTAL_FIELDS:
+            if field in row_in:
+                second[field] = ''
+        first['collisionWith'] = second['Number']
+        second['collisionWith'] = first['Number']
+        return first, second
 
     def clean(self, row):
-        operator = row.get('Operator', '')
-        if operator.startswith('Military - '):
-            row['Military'] = True
-            row['Operator'] = operator.replace('Military - ', '')
-        row = self.get_manufacturer_and_type(row)
+        """returns a cleaned copy of row"""
+        with self.instrumentation.timer('clean'):
+            row = dict(row)
+            operator, military = self.cleaned_value(
+                'Operator',
+                row.get('Operator', ''))
+            if military:
+                row['Military'] = True
+                row['Operator'] = operator
+            row = self.get_manufacturer_and_type(row)
         return row
 
+    def cleaned_value(self, field, value):
+        lookup = self.lookups.get(field)
+        if lookup is not None and value in lookup:
+            cleaned, counted, not_found = lookup[value]
+            # every row counts its words, as if it had been spellchecked
+            self.spellchecker.replay(counted, not_found)
+            return cleaned
+        if field == 'Operator':
+            return self.clean_operator(value)
+        return self.clean_type(value)
 
+    def clean_operator(self, operator):
+        """returns the operator without the military prefix and whether the
+        prefix was there"""
+        if operator.startswith(self.MILITARY_PREFIX):
+            return operator.replace(self.MILITARY_PREFIX, ''), True
+        return operator, False
 
     def get_manufacturer_and_type(self, row):
+        row['Manufacturer'], row['Type'], row['Variant'] = \
+            self.classifier.classify(self.cleaned_value('Type', row['Type']))
+        return row
+
+    def clean_type(self, aircraft_type):
 
-        aircraft_type = row['Type'].strip()
-        print('aircraft_type:', aircraft_type)
-        if aircraft_type.endswith(' (airship)'):
-            aircraft_type = aircraft_type[:-10]
+        aircraft_type = aircraft_type.strip()
+        if self.verbose:
+            print('aircraft_type:', aircraft_type)
+        if aircraft_type.endswith(self.AIRSHIP_SUFFIX):
+            aircraft_type = aircraft_type[:-len(self.AIRSHIP_SUFFIX)]
             
-        row['Type'] = "".join(
+        return self.spellcheck_type(aircraft_type)
+
+    def count_values(self, input_filepath, offset=0, input_offset=None):
+        """Returns the number of rows and a Counter of the values of each of
+        DEDUPE_FIELDS in the rows run would clean: those from input_offset,
+        the byte offset a resumed run reads from, or else those after the
+        first offset rows, collisions split as in run"""
+        counts = {field: Counter() for field in self.DEDUPE_FIELDS}
+        rows = 0
+        row_counter, self.row_counter = self.row_counter, 0
+        with open(input_filepath, 'rb') as csv_in:
+            lines = self.lines_from_csv(csv_in)
+            header = next(csv_reader(lines))
+            if input_offset is not None:
+                csv_in.seek(input_offset)
+                offset = 0
+            for row in self.marked_rows(
+                    self.rows_from_csv(lines, header),
+                    offset):
+                rows += 1
+                for field, counter in counts.items():
+                    counter[row.get(field, '')] += 1
+        self.row_counter = row_counter
+        return rows, counts
+
+    def dedupe(
+            self,
+            input_filepath,
+            out_file=stderr,
+            offset=0,
+            input_offset=None):
+        """Pre-pass that cleans each distinct value of DEDUPE_FIELDS once,
+        clean() then takes the results from self.lookups and counts the
+        value's occurances and words not found again.  Only the rows run
+        would clean are read, see count_values().  Writes how many
+        cleanings were saved to out_file and returns {field: (values,
+        distinct values)}."""
+        rows, counts = self.count_values(input_filepath, offset, input_offset)
+        report = {}
+        for field, counter in counts.items():
+            lookup = {}
+            self.lookups.pop(field, None)
+            # Counter keeps the values in order of first appearance
+            for value in counter:
+                with self.spellchecker.recording() as (counted, not_found):
+                    cleaned = self.cleaned_value(field, value)
+                lookup[value] = cleaned, counted, not_found
+            self.lookups[field] = lookup
+            report[field] = rows, len(counter)
+            saved = rows - len(counter)
+            out_file.write(
+                '{}: {} values, {} distinct, {} cleanings saved '
+                '({:.1%})\n'.format(
+                    field,
+                    rows,
+                    len(counter),
+                    saved,
+                    saved / rows if rows else 0))
+        return report
+
+    def spellcheck_type(self, aircraft_type):
+        return "".join(
             self.spellchecker.check_text(
                 aircraft_type,
                 self.tokenizer
             )
         )
 
-        return row
-
     def next_row_number(self):
         next = self.row_counter
         self.row_counter += 1
         return next
 
-    def rows_from_csv(self, csv_file):
+    def lines_from_csv(self, csv_file, encoding='utf-8'):
+        """Decodes lines from a csv file opened in binary mode, keeping
+        self.input_offset at the end of the last line read"""
+        for line in csv_file:
+            self.input_offset += len(line)
+            yield line.decode(encoding)
+
+    def rows_from_csv(self, csv_file, fieldnames=None):
         """Generator returns Row objects from csv"""
-        reader = DictReader(csv_file)
+        reader = DictReader(csv_file, fieldnames=fieldnames)
         for csv_row in reader:
             csv_row['Number'] = self.next_row_number()
             yield csv_row
 
-    def run(self, input_filepath, output_filepath, offset=0):
-        with open(input_filepath, 'r') as csv_in, \
-                open(output_filepath, 'w') as csv_out:
+    def marked_rows(self, rows, offset=0, marks=None):
+        """Splits collision rows and skips the first offset of the resulting
+        rows.  After each input row, if marks is a deque, appends the number
+        of rows yielded so far with the input offset and row counter a run
+        could resume from once those rows are written."""
+        index = 0
+        yielded = 0
+        for row in rows:
+            split_rows = []
+            for split_row in self.split_collision_rows([row]):
+                if index >= offset:
+                    split_rows.append(split_row)
+                index += 1
+            yielded += len(split_rows)
+            if marks is not None:
+                marks.append((yielded, self.input_offset, self.row_counter))
+            yield from split_rows
+
+    def clean_verbose(self, rows, offset=0):
+        """cleans rows one at a time, printing each row before and after"""
+        for i, row in enumerate(rows, offset):
+            if i > offset:
+                print('=' * 80)
+            print("IN  {0:> 4}: {1}".format(i, row))
+            print('-' * 80)
+            row = self.clean(row)
+            print("OUT {0:> 4}: {1}".format(i, row))
+            yield row
+
+    def clean_parallel(
+            self,
+            rows,
+            jobs,
+            chunk_size,
+            max_in_flight=None,
+            compact_path=None):
+        """Cleans rows in a pool of jobs worker processes, chunk_size rows at
+        a time, and yields them in input order.  Each worker spellchecks
+        against a read-only snapshot of the dictionary, or, with
+        compact_path, against the dictionary compiled to that file.  If the
+        dictionary is shared, the workers open the file itself and their
+        occurance counts are written to it.  At most
+        max_in_flight chunks (2 per worker by default) are queued or held
+        waiting for an earlier chunk."""
+        if max_in_flight is None:
+            max_in_flight = 2 * jobs
+        spellchecker = self.spellchecker
+        dictionary = spellchecker.dictionary
+        # workers read the dictionary file, so buffered changes go first
+        dictionary.flush()
+        if compact_path is not None:
+            compile_dictionary(dictionary, compact_path)
+        initargs = (
+            dictionary.db_file,
+            dictionary.delete_index,
+            dictionary.trie is not None,
+            spellchecker.confidence_threshold,
+            spellchecker.max_distance,
+            self.lookups,
+            compact_path,
+            dictionary.shared,
+            self.classifier.manufacturers())
+
+        with ProcessPoolExecutor(
+                jobs,
+                initializer=init_worker,
+                initargs=initargs) as executor:
+            in_flight = deque()
+            for chunk in chunks(rows, chunk_size):
+                in_flight.append(executor.submit(clean_chunk, chunk))
+                if len(in_flight) < max_in_flight:
+                    continue
+                cleaned, words_not_found = in_flight.popleft().result()
+                spellchecker.words_not_found.update(words_not_found)
+                yield from cleaned
+            while in_flight:
+                cleaned, words_not_found = in_flight.popleft().result()
+                spellchecker.words_not_found.update(words_not_found)
+                yield from cleaned
+
+    def save_checkpoint(
+            self,
+            checkpoint,
+            input_filepath,
+            csv_out,
+            input_offset,
+            row_counter):
+        csv_out.flush()
+        fsync(csv_out.fileno())
+        self.spellchecker.dictionary.flush()
+        checkpoint.save(
+            input_offset=input_offset,
+            input_tail=tail_digest(input_filepath, input_offset),
+            output_offset=csv_out.tell(),
+            row_counter=row_counter)
+
+    @staticmethod
+    def can_resume(checkpoint, input_filepath, output_filepath):
+        """True if the input still has the bytes the checkpoint read up to,
+        as far as the digest of their tail tells, and the output the rows
+        written"""
+        state = checkpoint.state
+        if not exists(output_filepath) \
+                or getsize(output_filepath) < state['output_offset'] \
+                or getsize(input_filepath) < state['input_offset']:
+            return False
+        return state.get('input_tail') == tail_digest(
+            input_filepath, state['input_offset'])
+
+    def run(
+            self,
+            input_filepath,
+            output_filepath,
+            offset=0,
+            jobs=1,
+            chunk_size=100,
+            checkpoint_path=None,
+            checkpoint_every=500,
+            dedupe=False,
+            verbose=False,
+            compact_path=None):
+        """Cleans input_filepath into output_filepath.  With checkpoint_path,
+        progress is saved every checkpoint_every input rows.  If a checkpoint
+        from an earlier, unfinished run of the same input exists, reading
+        resumes from its input offset, the output is cut back to its output
+        offset and appended to, and offset is ignored.  With dedupe,
+        distinct Type values are spellchecked in a pre-pass, see dedupe().
+        With verbose, every row is printed before and after cleaning.
+        compact_path is passed on to clean_parallel."""
+        self.verbose = verbose
+        self.instrumentation.trace_dictionary(self.spellchecker.dictionary)
+
+        checkpoint = None
+        resume = False
+        if checkpoint_path is not None:
+            checkpoint = Checkpoint(checkpoint_path)
+            # a changed input or output is cleaned again from the start
+            resume = checkpoint.load() and self.can_resume(
+                checkpoint, input_filepath, output_filepath)
+
+        if resume:
+            # drop any rows written after the checkpoint was saved
+            with open(output_filepath, 'r+b') as csv_out:
+                csv_out.truncate(checkpoint.state['output_offset'])
+            offset = 0
+
+        if dedupe:
+            self.dedupe(
+                input_filepath,
+                offset=offset,
+                input_offset=checkpoint.state['input_offset'] if resume
+                    else None)
+
+        with open(input_filepath, 'rb') as csv_in, \
+                open(output_filepath, 'a' if resume else 'w', newline='') \
+                as csv_out:
 
             self.row_counter = 0
-            fieldnames = self.FIELD_ORDER \
-                + ['Registration', 'Flight #', 'cn/In']
+            self.input_offset = 0
 
             # Setup writer
-            csvWriter = DictWriter(csv_out, fieldnames=fieldnames)
-            csvWriter.writeheader()
-            
-            for i, row in enumerate(
-                    self.split_collision_rows(
-                        self.rows_from_csv(csv_in))):
-                if i < offset:
+            csvWriter = DictWriter(
+                csv_out,
+                fieldnames=self.OUTPUT_FIELDS,
+                extrasaction='ignore')
+
+            lines = self.lines_from_csv(csv_in)
+            header = next(csv_reader(lines))
+            if resume:
+                csv_in.seek(checkpoint.state['input_offset'])
+                self.input_offset = checkpoint.state['input_offset']
+                self.row_counter = checkpoint.state['row_counter']
+            else:
+                csvWriter.writeheader()
+
+            marks = deque() if checkpoint is not None else None
+            rows = self.marked_rows(
+                self.rows_from_csv(lines, header),
+                offset,
+                marks)
+            if jobs > 1:
+                rows = self.clean_parallel(
+                    rows, jobs, chunk_size, compact_path=compact_path)
+            elif verbose:
+                rows = self.clean_verbose(rows, offset)
+            else:
+                rows = map(self.clean, rows)
+
+            since_checkpoint = 0
+            for written, row in enumerate(rows, 1):
+                with self.instrumentation.timer('write'):
+                    csvWriter.writerow(row)
+                self.instrumentation.row_done()
+                if marks is None:
+                    continue
+                mark = None
+                while marks and marks[0][0] <= written:
+                    mark = marks.popleft()
+                    since_checkpoint += 1
+                if mark is None or since_checkpoint < checkpoint_every:
                     continue
-                if i > 0:
-                    print('=' * 80)
-                print("IN  {0:> 4}: {1}".format(i, row))
-                print('-' * 80)
-                row = self.clean(row)
-                print("OUT {0:> 4}: {1}".format(i, row))
+                rows_through, input_offset, row_counter = mark
+                # only checkpoint once every row split from an input row
+                # has been written
+                if rows_through == written:
+                    self.save_checkpoint(
+                        checkpoint,
+                        input_filepath,
+                        csv_out,
+                        input_offset,
+                        row_counter)
+                    since_checkpoint = 0
+
+        if checkpoint is not None:
+            # the run finished, the next one starts from scratch
+            checkpoint.remove()
                     
 
 
@@ -186,15 +655,49 @@ class CrashDataCleaner(object):
                 # freq_file.write('{},{}\n'.format(freq, word))
 
 def main(args):
-    print('args', args)
-    with Dictionary('aircraft.sqlite') as dictionary:
-        spellchecker = SpellChecker(dictionary, True) 
-        cleaner = CrashDataCleaner(spellchecker)
-        cleaner.run(
-            args.input_file,
-            args.output_file,
-            args.offset,
-        )
+    if args.verbose:
+        print('args', args)
+    if args.progress or args.report:
+        instrumentation = Instrumentation(args.progress)
+    else:
+        instrumentation = NULL_INSTRUMENTATION
+    if args.shared:
+        dictionary = SharedDictionary('aircraft.sqlite', delete_index=True)
+    else:
+        dictionary = CachedDictionary('aircraft.sqlite', delete_index=True)
+    with dictionary:
+        spellchecker = SpellChecker(
+            dictionary,
+            interactive=not args.batch,
+            confidence_threshold=args.confidence,
+            max_distance=args.max_distance,
+            instrumentation=instrumentation)
+        if args.trie:
+            dictionary.build_trie()
+        cleaner = CrashDataCleaner(spellchecker, instrumentation)
+        if args.columnar:
+            from columnar import ColumnarCrashDataCleaner
+            ColumnarCrashDataCleaner(cleaner).run(
+                args.input_file,
+                args.output_file,
+                args.offset)
+        else:
+            cleaner.run(
+                args.input_file,
+                args.output_file,
+                args.offset,
+                args.jobs,
+                args.chunk_size,
+                args.checkpoint,
+                args.checkpoint_every,
+                args.dedupe,
+                args.verbose,
+                args.compact,
+            )
+    if args.batch:
+        spellchecker.dump_words_not_found(stderr)
+    if args.report:
+        instrumentation.write_report(args.report)
 
 if __name__ == '__main__':
     parser = ArgumentParser(description='Clean aircraft crash data')
@@ -203,11 +706,95 @@ if __name__ == '__main__':
         type=int,
         default=0,
         help="start processing at specified record in data file")
+    parser.add_argument(
+        '-b', '--batch',
+        action='store_true',
+        help="correct words automatically instead of prompting")
+    parser.add_argument(
+        '-c', '--confidence',
+        type=float,
+        default=0.5,
+        help="minimum confidence for an automatic correction, words below "
+            "it are left unchanged and reported on stderr")
+    parser.add_argument(
+        '-m', '--max-distance',
+        type=int,
+        default=2,
+        help="largest edit distance automatic corrections are searched at, "
+            "more than 2 requires --trie")
+    parser.add_argument(
+        '--trie',
+        action='store_true',
+        help="search corrections in a trie of the dictionary")
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help="number of worker processes, more than 1 requires --batch")
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=100,
+        help="rows sent to a worker process at a time")
+    parser.add_argument(
+        '--compact',
+        metavar='FILE',
+        help="compile the dictionary to FILE and have the --jobs workers "
+            "share it memory mapped instead of each copying it")
+    parser.add_argument(
+        '--shared',
+        action='store_true',
+        help="open the dictionary in WAL mode and have the --jobs workers "
+            "count occurances into it instead of into private copies")
+    parser.add_argument(
+        '--checkpoint',
+        help="file to save progress to, an unfinished run is resumed from "
+            "it (--offset is then ignored)")
+    parser.add_argument(
+        '--checkpoint-every',
+        type=int,
+        default=500,
+        help="input rows between checkpoints")
+    parser.add_argument(
+        '--dedupe',
+        action='store_true',
+        help="spellcheck each distinct Type value once before writing the "
+            "rows")
+    parser.add_argument(
+        '--columnar',
+        action='store_true',
+        help="clean the whole file as pandas columns, spellchecking each "
+            "distinct Type once (needs pandas)")
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help="print every row before and after cleaning")
+    parser.add_argument(
+        '--progress',
+        type=int,
+        default=0,
+        metavar='ROWS',
+        help="print a progress line to stderr every ROWS rows")
+    parser.add_argument(
+        '--report',
+        help="write counters and per-stage timings to this JSON file, "
+            "work done in --jobs worker processes isn't included")
     parser.add_argument(
         "input_file",
         help="Input file")
     parser.add_argument(
         "output_file",
         help="Output file")
-    main(parser.parse_args())
+    args = parser.parse_args()
+    if args.jobs > 1 and not args.batch:
+        parser.error("--jobs requires --batch")
+    if args.max_distance > 2 and not args.trie:
+        parser.error("--max-distance over 2 requires --trie")
+    if args.columnar and (args.jobs > 1 or args.checkpoint):
+        parser.error("--columnar can't be used with --jobs or --checkpoint")
+    if args.compact and args.jobs < 2:
+        parser.error("--compact requires --jobs")
+    if args.compact and args.shared:
+        parser.error("--compact workers can't write to a --shared dictionary")
+    main(args)
 
@@ -0,0 +1,115 @@
+from csv import reader as csv_reader
+
+from pandas import concat, DataFrame, factorize, Series
+
+
+class ColumnarCrashDataCleaner(object):
+    """Cleans the whole crash data set as pandas columns.  The output matches
+    CrashDataCleaner.run, but the Military prefix and airship suffix are
+    handled with vectorized string operations, collisions are found with one
+    mask over the Type and category columns, and each distinct Type is
+    spellchecked and classified only once."""
+
+    def __init__(self, cleaner):
+        self.cleaner = cleaner
+
+    def read(self, input_filepath, offset=0):
+        """returns a frame of the rows CrashDataCleaner.run would clean"""
+        cleaner = self.cleaner
+        cleaner.row_counter = 0
+        cleaner.input_offset = 0
+        with open(input_filepath, 'rb') as csv_in:
+            lines = cleaner.lines_from_csv(csv_in)
+            header = next(csv_reader(lines))
+            frame = DataFrame.from_records(
+                list(cleaner.rows_from_csv(lines, header)))
+        if frame.empty:
+            return frame
+        frame = self.split_collisions(frame)
+        return frame.iloc[offset:].reset_index(drop=True)
+
+    def split_collisions(self, frame):
+        """Fills in the category of each row and splits each collision row
+        in two like CrashDataCleaner.split_collision_rows, numbering the
+        rows the same way"""
+        cleaner = self.cleaner
+        tags = frame['Summary'].fillna('').map(cleaner.tagger.tags)
+        frame['category'] = tags.map(cleaner.tagger.SEPARATOR.join)
+        tagged_collision = Series(
+            [cleaner.COLLISION_CATEGORY in categories for categories in tags],
+            index=frame.index)
+        collision = frame['Type'].fillna('').str.contains('/', regex=False) \
+            & tagged_collision
+
+        # rows are numbered in order, the second aircraft of a collision
+        # right after the first
+        split_before = collision.cumsum() - collision
+        numbers = Series(range(len(frame)), index=frame.index) + split_before
+        first = frame.copy()
+        first['Number'] = numbers
+        first['collisionWith'] = Series('', index=frame.index, dtype=object) \
+            .mask(collision, numbers + 1)
+        second = first[collision].copy()
+        second['Number'] = numbers[collision] + 1
+        second['collisionWith'] = numbers[collision]
+
+        for field in cleaner.COLLISION_SPLIT_FIELDS:
+            if field not in frame:
+                continue
+            values = frame.loc[collision, field].fillna('')
+            pieces = values.str.split('/', regex=False)
+            two = pieces.str.len() == 2
+            first.loc[collision, field] = values.mask(
+                two, pieces.str[0].str.strip())
+            second[field] = values.mask(two, pieces.str[1].str.strip())
+        for field in cleaner.COLLISION_TOTAL_FIELDS:
+            if field in frame:
+                second[field] = ''
+
+        return concat([first, second]) \
+            .sort_values('Number', kind='stable') \
+            .reset_index(drop=True)
+
+    def clean_operators(self, frame):
+        prefix = self.cleaner.MILITARY_PREFIX
+        operators = frame['Operator'].fillna('')
+        military = operators.str.startswith(prefix)
+        frame['Military'] = Series('', index=frame.index, dtype=object) \
+            .mask(military, True)
+        frame['Operator'] = operators.mask(
+            military,
+            operators.str.replace(prefix, '', regex=False))
+        return frame
+
+    def clean_types(self, frame):
+        suffix = self.cleaner.AIRSHIP_SUFFIX
+        types = frame['Type'].fillna('').str.strip()
+        airship = types.str.endswith(suffix)
+        types = types.mask(airship, types.str[:-len(suffix)])
+
+        # spellcheck the distinct values in order of first appearance and
+        # map the results back through the codes
+        codes, uniques = factorize(types)
+        classified = DataFrame.from_records(
+            [
+                self.cleaner.classifier.classify(
+                    self.cleaner.spellcheck_type(value))
+                for value in uniques
+            ],
+            columns=['Manufacturer', 'Type', 'Variant'])
+        for column in classified.columns:
+            frame[column] = classified[column].take(codes).to_numpy()
+        return frame
+
+    def clean(self, frame):
+        frame = self.clean_operators(frame)
+        frame = self.clean_types(frame)
+        return frame
+
+    def run(self, input_filepath, output_filepath, offset=0):
+        frame = self.clean(self.read(input_filepath, offset))
+        frame = frame.reindex(columns=self.cleaner.OUTPUT_FIELDS)
+        frame.fillna('').to_csv(
+            output_filepath,
+            index=False,
+            lineterminator='\r\n')
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""Read-only, memory mapped dictionary format.
+
+A compiled file holds the words sorted by their UTF-8 bytes with parallel
+arrays of occurance counts and word offsets, the sorted skips, and the
+bigrams laid out like the words, keyed by "first second".  Opening
+one is a single mmap call, lookups are binary searches over the mapped pages,
+and every process that opens the same file shares one copy of it in the page
+cache.
+
+Layout, in native byte order:
+    header          magic, little endian flag, format version,
+                    words_scanned, words, skips, bigrams
+    counts          unsigned 64 bit occurances, one per word
+    bigram counts   unsigned 64 bit occurances, one per bigram
+    word offsets    unsigned 32 bit offsets into the word bytes, words + 1
+    skip offsets    unsigned 32 bit offsets into the skip bytes, skips + 1
+    bigram offsets  unsigned 32 bit offsets into the bigram bytes, bigrams + 1
+    word bytes      the UTF-8 encoded words, back to back
+    skip bytes      the UTF-8 encoded skips, back to back
+    bigram bytes    the UTF-8 encoded bigram keys, back to back
+"""
+
+from argparse import ArgumentParser
+from array import array
+from contextlib import closing
+from mmap import ACCESS_READ, mmap
+from os import replace
+from struct import Struct
+from sys import byteorder
+
+from dictionary import Dictionary, DictionaryError, WordRecord
+from trie import Trie
+
+
+MAGIC = b'CDCT'
+FORMAT_VERSION = 2
+HEADER = Struct('=4sBBxxQIII')
+
+
+def bigram_key(first, second):
+    return first + ' ' + second
+
+
+def utf8_sorted(keys):
+    return sorted(keys, key=lambda key: key.encode('utf-8'))
+
+
+def encoded_section(words):
+    """returns the offsets array and the bytes of words"""
+    encoded = [word.encode('utf-8') for word in words]
+    offsets = array('I', [0])
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+    return offsets, b''.join(encoded)
+
+
+def compile_dictionary(dictionary, out_path):
+    """writes the words, skips and bigrams of dictionary to out_path"""
+    words = dict(dictionary.items())
+    words_sorted = utf8_sorted(words)
+    skips = utf8_sorted(dictionary.all_skips())
+    bigrams = {
+        bigram_key(first, second): occurances
+        for first, second, occurances in dictionary.bigram_items()}
+    bigrams_sorted = utf8_sorted(bigrams)
+
+    counts = array('Q', [words[word] for word in words_sorted])
+    bigram_counts = array('Q', [bigrams[key] for key in bigrams_sorted])
+    word_offsets, word_bytes = encoded_section(words_sorted)
+    skip_offsets, skip_bytes = encoded_section(skips)
+    bigram_offsets, bigram_bytes = encoded_section(bigrams_sorted)
+
+    temp_path = out_path + '.tmp'
+    with open(temp_path, 'wb') as out_file:
+        out_file.write(HEADER.pack(
+            MAGIC,
+            byteorder == 'little',
+            FORMAT_VERSION,
+            dictionary.words_scanned,
+            len(words_sorted),
+            len(skips),
+            len(bigrams_sorted)))
+        for section in (
+                counts,
+                bigram_counts,
+                word_offsets,
+                skip_offsets,
+                bigram_offsets):
+            section.tofile(out_file)
+        for section in (word_bytes, skip_bytes, bigram_bytes):
+            out_file.write(section)
+    replace(temp_path, out_path)
+
+
+class CompactPrefixes(object):
+    """The prefixes of the words of a CompactDictionary, looked up in the
+    mapped words as they are asked for instead of built up front.  Answers
+    are remembered, so each prefix is searched for once."""
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+        self.known = {}
+
+    def __contains__(self, prefix):
+        found = self.known.get(prefix)
+        if found is None:
+            found = self.known[prefix] = self.dictionary.has_prefix(prefix)
+        return found
+
+
+class CompactDictionary(object):
+    """Read-only dictionary over a file written by compile_dictionary.
+    Occurances counted while it is in use are discarded."""
+
+    delete_index = False
+
+    def __init__(self, path):
+        self.db_file = path
+        self.version = 0
+        self.trie = None
+        self.prefix_set = None
+        with open(path, 'rb') as compiled:
+            self.map = mmap(compiled.fileno(), 0, access=ACCESS_READ)
+
+        magic, little_endian, version, self.words_scanned, words, skips, \
+            bigrams = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise DictionaryError(
+                "{} isn't a compiled dictionary".format(path))
+        if version != FORMAT_VERSION:
+            raise DictionaryError(
+                "{} was compiled with another format version".format(path))
+        if bool(little_endian) != (byteorder == 'little'):
+            raise DictionaryError(
+                "{} was compiled with a different byte order".format(path))
+
+        self.view = memoryview(self.map)
+        self.start = HEADER.size
+        self.counts = self.next_array('Q', words)
+        self.bigram_counts = self.next_array('Q', bigrams)
+        self.word_offsets = self.next_array('I', words + 1)
+        self.skip_offsets = self.next_array('I', skips + 1)
+        self.bigram_offsets = self.next_array('I', bigrams + 1)
+        self.word_start = self.start
+        self.skip_start = self.word_start + self.word_offsets[words]
+        self.bigram_start = self.skip_start + self.skip_offsets[skips]
+
+    def next_array(self, typecode, length):
+        """returns the next length items of the file as a typed view"""
+        size = length * array(typecode).itemsize
+        view = self.view[self.start:self.start + size].cast(typecode)
+        self.start += size
+        return view
+
+    def close(self):
+        for view in (
+                self.counts,
+                self.bigram_counts,
+                self.word_offsets,
+                self.skip_offsets,
+                self.bigram_offsets,
+                self.view):
+            view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def entry(self, start, offsets, i):
+        return self.map[start + offsets[i]:start + offsets[i + 1]]
+
+    def search(self, start, offsets, word):
+        """returns the index of word in a section or -1"""
+        key = word.encode('utf-8')
+        low = 0
+        high = len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            entry = self.entry(start, offsets, middle)
+            if entry < key:
+                low = middle + 1
+            elif entry > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def has_prefix(self, prefix):
+        """True if some word starts with prefix"""
+        key = prefix.encode('utf-8')
+        low = 0
+        high = len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(self.word_start, self.word_offsets, middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low < len(self) and self.entry(
+            self.word_start, self.word_offsets, low).startswith(key)
+
+    def prefixes(self):
+        if self.prefix_set is None:
+            self.prefix_set = CompactPrefixes(self)
+        return self.prefix_set
+
+    def characters(self):
+        return set(self.map[self.word_start:self.skip_start].decode('utf-8'))
+
+    def find(self, word):
+        return self.search(self.word_start, self.word_offsets, word)
+
+    def __getitem__(self, word):
+        if not isinstance(word, str):
+            raise TypeError("key should be a string")
+        i = self.find(word)
+        if i < 0:
+            raise KeyError("'{}' not found".format(word))
+        return WordRecord(word, self.counts[i])
+
+    def __contains__(self, word):
+        return self.find(word) >= 0
+
+    def lookup_many(self, words):
+        found = {}
+        for word in set(words):
+            i = self.find(word)
+            if i >= 0:
+                found[word] = self.counts[i]
+        return found
+
+    def probability(self, word):
+        return self.occurance_probability(self[word].occurances)
+
+    def occurance_probability(self, occurances):
+        if self.words_scanned <= 0:
+            return 1
+        return 1.0 * occurances / self.words_scanned
+
+    def bigram_items(self):
+        items = []
+        for i in range(len(self.bigram_counts)):
+            key = self.entry(self.bigram_start, self.bigram_offsets, i)
+            first, second = key.decode('utf-8').split(' ')
+            items.append((first, second, self.bigram_counts[i]))
+        return items
+
+    def lookup_bigrams(self, pairs):
+        found = {}
+        for pair in set(pairs):
+            i = self.search(
+                self.bigram_start, self.bigram_offsets, bigram_key(*pair))
+            if i >= 0:
+                found[pair] = self.bigram_counts[i]
+        return found
+
+    def in_skips(self, word):
+        return self.search(self.skip_start, self.skip_offsets, word) >= 0
+
+    def all_words(self):
+        return [
+            self.entry(self.word_start, self.word_offsets, i).decode('utf-8')
+            for i in range(len(self))]
+
+    def build_trie(self):
+        self.trie = Trie(self.all_words())
+        return self.trie
+
+    def words_within(self, word, max_distance):
+        if self.trie is None:
+            self.build_trie()
+        return self.trie.search(word, max_distance)
+
+    def add_occurance(self, word):
+        pass
+
+    def flush(self):
+        pass
+
+    def add(self, word, occurances=1):
+        raise DictionaryError("compiled dictionaries are read-only")
+
+    def add_skip(self, word):
+        raise DictionaryError("compiled dictionaries are read-only")
+
+    def similar_words(self, word, max_distance=1):
+        raise DictionaryError("delete index is not enabled")
+
+
+def main(args):
+    dictionary = Dictionary(args.db_file, snapshot=True)
+    with closing(dictionary.conn):
+        compile_dictionary(dictionary, args.output_file)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Compile a sqlite dictionary to the compact format')
+    parser.add_argument(
+        "db_file",
+        help="sqlite dictionary")
+    parser.add_argument(
+        "output_file",
+        help="compiled dictionary")
+    main(parser.parse_args())
@@ -1,6 +1,14 @@
 #!/usr/bin/env python3
 
+from collections import Counter, defaultdict
+from contextlib import closing
+from itertools import chain
 from sqlite3 import connect
+from threading import local, RLock
+from time import monotonic
+
+from tokenizer import FastTokenizer
+from trie import Trie
 
 
 # https://norvig.com/spell-correct.html
@@ -12,6 +20,24 @@ class DictionaryError(RuntimeError):
     pass
 
 
+def delete_neighborhood(word, max_distance):
+    """returns the set of strings made by deleting up to max_distance
+    characters from word, including word itself"""
+    neighborhood = {word}
+    edge = {word}
+    for _ in range(max_distance):
+        edge = {w[:i] + w[i+1:] for w in edge for i in range(len(w))}
+        neighborhood |= edge
+    return neighborhood
+
+
+def chunked(items, size):
+    """yields lists of up to size items"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
 class WordRecord(object):
     """represents a record in the words table of the dictionary"""
     def __init__(self, word, occurances=1):
@@ -42,19 +68,100 @@ class Dictionary(object):
                 words_scanned INTEGER NOT NULL DEFAULT(0))""",
         """CREATE TABLE IF NOT EXISTS skips(
                 word TEXT NOT NULL UNIQUE)""",
+        """CREATE TABLE IF NOT EXISTS bigrams(
+                first TEXT NOT NULL,
+                second TEXT NOT NULL,
+                occurances INTEGER NOT NULL DEFAULT (1),
+                UNIQUE(first, second))""",
+        """CREATE TABLE IF NOT EXISTS manufacturers(
+                name TEXT NOT NULL UNIQUE)""",
     ]
 
-    def __init__(self, db_file):
-        self.conn = connect(db_file)
-        self.cursor = self.conn.cursor()
+    DELETES_TABLE_DEF = """CREATE TABLE IF NOT EXISTS deletes(
+                deletion TEXT NOT NULL,
+                word TEXT NOT NULL,
+                UNIQUE(deletion, word))"""
+
+    # The deletes table holds the delete neighborhood of every word out to
+    # this distance, so similar_words can answer max_distance <= 2.
+    DELETE_DISTANCE = 2
+
+    # keep IN (...) lists below sqlite's host parameter limit
+    MAX_SQL_PARAMETERS = 500
+
+    UPSERT_SQL = """INSERT INTO words(word, occurances) VALUES(?, ?)
+        ON CONFLICT(word) DO UPDATE
+        SET occurances = occurances + excluded.occurances"""
+
+    BIGRAM_UPSERT_SQL = """INSERT INTO bigrams(first, second, occurances)
+        VALUES(?, ?, ?)
+        ON CONFLICT(first, second) DO UPDATE
+        SET occurances = occurances + excluded.occurances"""
+
+    # True when other threads and processes can use the same file at once
+    shared = False
+
+    def __init__(self, db_file, delete_index=False, snapshot=False):
+        """With snapshot=True the dictionary works on a private in-memory copy
+        of db_file, changes are never written back."""
+        self.db_file = db_file
+        self.open_connection(snapshot)
         self.words_scanned = 0
+        self.delete_index = delete_index
+        # incremented whenever a word or skip is added
+        self.version = 0
+        # built on request by build_trie()
+        self.trie = None
+        # built on request by prefixes()
+        self.prefix_set = None
         self.initialize()
 
+    def open_connection(self, snapshot):
+        if snapshot:
+            self.conn = connect(':memory:')
+            with closing(connect(self.db_file)) as source:
+                source.backup(self.conn)
+        else:
+            self.conn = connect(self.db_file)
+        self.cursor = self.conn.cursor()
+
     def initialize(self):
         for table_def in self.TABLE_DEFS:
             self.cursor.execute(table_def)
+        if self.delete_index:
+            self.cursor.execute(self.DELETES_TABLE_DEF)
         self.conn.commit()
+        # a deletes table that was built earlier is kept up to date even
+        # when the index isn't used, it is never rebuilt once filled
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'deletes'")
+        self.keep_deletes = self.cursor.fetchone() is not None
         self.initialize_stats()
+        if self.delete_index:
+            self.initialize_deletes()
+
+    def initialize_deletes(self):
+        """Adds the deletes of the words that have none, e.g. when the index
+        is enabled on an existing dictionary or words were added while it
+        wasn't kept up to date.  Every word is one of its own deletes, so
+        that record is looked for."""
+        self.cursor.execute("""SELECT word FROM words WHERE NOT EXISTS (
+            SELECT 1 FROM deletes
+            WHERE deletes.deletion = words.word
+            AND deletes.word = words.word)""")
+        for record in self.cursor.fetchall():
+            self.insert_deletes(record[0])
+        self.conn.commit()
+
+    @classmethod
+    def delete_records(cls, word):
+        for deletion in delete_neighborhood(word, cls.DELETE_DISTANCE):
+            yield deletion, word
+
+    def insert_deletes(self, word):
+        sql = "INSERT OR IGNORE INTO deletes(deletion, word) VALUES(?, ?)"
+        self.cursor.executemany(sql, self.delete_records(word))
 
     def initialize_stats(self):
         sql = "SELECT words_scanned FROM stats ORDER BY words_scanned DESC"
@@ -80,20 +187,191 @@ class Dictionary(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         return self.conn.__exit__(exc_type, exc_val, exc_tb)
 
+    def flush(self):
+        self.conn.commit()
+
     def add(self, word, occurances=1):
         if word in self:
             self.add_occurance(word)
             return False
-        sql = "INSERT INTO words(word, occurances) VALUES(?, ?)"
+        # another writer on the file can add the word after the check
+        sql = """INSERT INTO words(word, occurances) VALUES(?, ?)
+            ON CONFLICT(word) DO NOTHING"""
         self.cursor.execute(sql, (word, occurances))
+        if not self.cursor.rowcount:
+            self.conn.commit()
+            self.add_occurance(word)
+            return False
+        if self.keep_deletes:
+            self.insert_deletes(word)
         self.conn.commit()
+        self.index_word(word)
+        self.version += 1
         return True
 
+    def index_word(self, word):
+        """adds a new word to the trie and prefixes, if they were built"""
+        if self.trie is not None:
+            self.trie.add(word)
+        if self.prefix_set is not None:
+            self.prefix_set.update(word[:i] for i in range(1, len(word) + 1))
+
+    def add_counts(self, counts, words_scanned=None, bigrams=None):
+        """Adds counts, a {word: occurances} mapping, to the words table,
+        bigrams, a {(first, second): occurances} mapping, to the bigrams
+        table and words_scanned (by default the total of counts) to the
+        stats, all in one transaction.  Returns the words that are new to the
+        dictionary."""
+        if words_scanned is None:
+            words_scanned = sum(counts.values())
+        known = self.lookup_many(counts)
+        new_words = [word for word in counts if word not in known]
+        with self.conn:
+            self.cursor.executemany(self.UPSERT_SQL, counts.items())
+            if bigrams:
+                self.cursor.executemany(
+                    self.BIGRAM_UPSERT_SQL,
+                    [(first, second, occurances)
+                        for (first, second), occurances in bigrams.items()])
+            if self.keep_deletes:
+                for word in new_words:
+                    self.insert_deletes(word)
+            sql = "UPDATE stats SET words_scanned = words_scanned + ?"
+            self.cursor.execute(sql, (words_scanned,))
+            self.cursor.execute("SELECT words_scanned FROM stats")
+            self.words_scanned = self.cursor.fetchone()[0]
+        for word in new_words:
+            self.index_word(word)
+        if new_words:
+            self.version += 1
+        return new_words
+
+    def train(self, texts, tokenizer=None, chunk_size=10000):
+        """Counts the words (all letter tokens) of texts, and the bigrams of
+        words only separated by whitespace, and adds them with add_counts()
+        every chunk_size words.  Returns the number of words counted."""
+        if tokenizer is None:
+            tokenizer = FastTokenizer()
+        counts = Counter()
+        bigrams = Counter()
+        counted = 0
+        for text in texts:
+            previous = None
+            for token in tokenizer.tokenize(text):
+                if not token.isalpha():
+                    if not token.isspace():
+                        previous = None
+                    continue
+                counts[token] += 1
+                if previous is not None:
+                    bigrams[previous, token] += 1
+                previous = token
+                counted += 1
+                if counted % chunk_size == 0:
+                    self.add_counts(counts, bigrams=bigrams)
+                    counts = Counter()
+                    bigrams = Counter()
+        if counts:
+            self.add_counts(counts, bigrams=bigrams)
+        return counted
+
+    def all_words(self):
+        self.cursor.execute("SELECT word FROM words")
+        return [record[0] for record in self.cursor.fetchall()]
+
+    def items(self):
+        """returns a list of (word, occurances)"""
+        self.cursor.execute("SELECT word, occurances FROM words")
+        return self.cursor.fetchall()
+
+    def all_skips(self):
+        self.cursor.execute("SELECT word FROM skips")
+        return [record[0] for record in self.cursor.fetchall()]
+
+    def bigram_items(self):
+        """returns a list of (first, second, occurances)"""
+        self.cursor.execute("SELECT first, second, occurances FROM bigrams")
+        return self.cursor.fetchall()
+
+    def lookup_bigrams(self, pairs):
+        """Returns {(first, second): occurances} for each of pairs found in
+        the bigrams table"""
+        found = {}
+        for chunk in chunked(set(pairs), self.MAX_SQL_PARAMETERS // 2):
+            sql = """SELECT first, second, occurances FROM bigrams
+                WHERE (first, second) IN (VALUES {})""".format(
+                    ', '.join(['(?, ?)'] * len(chunk)))
+            self.cursor.execute(sql, list(chain.from_iterable(chunk)))
+            for first, second, occurances in self.cursor.fetchall():
+                found[first, second] = occurances
+        return found
+
+    def characters(self):
+        """returns the set of characters the words are made of"""
+        return set(chain.from_iterable(self.all_words()))
+
+    def prefixes(self):
+        """returns the set of every prefix of every word, which add() keeps
+        up to date once it is built"""
+        if self.prefix_set is None:
+            self.prefix_set = {
+                word[:i]
+                for word in self.all_words()
+                for i in range(1, len(word) + 1)}
+        return self.prefix_set
+
+    def build_trie(self):
+        """Builds a trie of the words, which add() keeps up to date, so
+        words_within can search bounded edit distances"""
+        self.trie = Trie(self.all_words())
+        return self.trie
+
+    def words_within(self, word, max_distance):
+        """returns a list of (dictionary word, distance) for every word
+        within max_distance edits of word"""
+        if self.trie is None:
+            self.build_trie()
+        return self.trie.search(word, max_distance)
+
+    def similar_words(self, word, max_distance=1):
+        """Returns the dictionary words that share a deletion with word.  This
+        is a superset of the words within max_distance edits of word, the
+        caller is expected to check the actual edit distance."""
+        if not self.delete_index:
+            raise DictionaryError("delete index is not enabled")
+        if max_distance > self.DELETE_DISTANCE:
+            raise ValueError(
+                "max_distance can't exceed {}".format(self.DELETE_DISTANCE))
+        deletions = delete_neighborhood(word, max_distance)
+        found = set()
+        for chunk in chunked(deletions, self.MAX_SQL_PARAMETERS):
+            sql = """SELECT DISTINCT word FROM deletes
+                WHERE deletion IN ({})
+                AND length(word) - length(deletion) <= ?""".format(
+                    ', '.join('?' * len(chunk)))
+            self.cursor.execute(sql, chunk + [max_distance])
+            found.update(record[0] for record in self.cursor.fetchall())
+        return found
+
+    def lookup_many(self, words):
+        """Returns {word: occurances} for each of words found in the
+        dictionary, using one query per MAX_SQL_PARAMETERS words"""
+        found = {}
+        for chunk in chunked(set(words), self.MAX_SQL_PARAMETERS):
+            sql = "SELECT word, occurances FROM words WHERE word IN ({})" \
+                .format(', '.join('?' * len(chunk)))
+            self.cursor.execute(sql, chunk)
+            found.update(self.cursor.fetchall())
+        return found
+
     def probability(self, word):
         word_record = self[word]
+        return self.occurance_probability(word_record.occurances)
+
+    def occurance_probability(self, occurances):
         if self.words_scanned <= 0:
             return 1
-        return 1.0 * word_record.occurances / self.words_scanned
+        return 1.0 * occurances / self.words_scanned
 
     def __getitem__(self, word):
         if not isinstance(word, str):
@@ -123,6 +401,277 @@ class Dictionary(object):
         return bool(self.cursor.fetchmany())
 
     def add_skip(self, word):
-        sql = "INSERT INTO skips(word) VALUES (?)"
+        sql = "INSERT OR IGNORE INTO skips(word) VALUES (?)"
         self.cursor.execute(sql, (word,))
         self.conn.commit()
+        self.version += 1
+
+    def all_manufacturers(self):
+        """returns the manufacturer names in the order they were added"""
+        self.cursor.execute("SELECT name FROM manufacturers ORDER BY rowid")
+        return [record[0] for record in self.cursor.fetchall()]
+
+    def add_manufacturer(self, name):
+        sql = "INSERT OR IGNORE INTO manufacturers(name) VALUES (?)"
+        self.cursor.execute(sql, (name,))
+        self.conn.commit()
+
+
+class CachedDictionary(Dictionary):
+    """Dictionary that answers reads from an in-memory copy of the words and
+    skips tables.  Occurance increments are buffered and written back to
+    sqlite in one batch when flush_threshold increments are pending, when
+    flush_interval seconds have passed since the last flush, or at __exit__.
+    """
+
+    def __init__(
+            self,
+            db_file,
+            delete_index=False,
+            snapshot=False,
+            flush_threshold=1000,
+            flush_interval=30.0):
+        self.flush_threshold = flush_threshold
+        self.flush_interval = flush_interval
+        self.words = {}
+        self.skips = set()
+        self.bigrams = {}
+        self.deletes = defaultdict(set)
+        self.pending = Counter()
+        self.pending_deletes = []
+        self.pending_count = 0
+        self.last_flush = monotonic()
+        super(CachedDictionary, self).__init__(
+            db_file, delete_index, snapshot)
+        self.load()
+
+    def load(self):
+        self.cursor.execute("SELECT word, occurances FROM words")
+        self.words = dict(self.cursor.fetchall())
+        self.cursor.execute("SELECT word FROM skips")
+        self.skips = {record[0] for record in self.cursor.fetchall()}
+        self.cursor.execute("SELECT first, second, occurances FROM bigrams")
+        self.bigrams = {
+            (first, second): occurances
+            for first, second, occurances in self.cursor.fetchall()}
+        if self.delete_index:
+            self.cursor.execute("SELECT deletion, word FROM deletes")
+            for deletion, word in self.cursor.fetchall():
+                self.deletes[deletion].add(word)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+        return super(CachedDictionary, self).__exit__(
+            exc_type, exc_val, exc_tb)
+
+    def buffer(self, word, occurances):
+        self.pending[word] += occurances
+        self.pending_count += 1
+        if self.pending_count >= self.flush_threshold:
+            self.flush()
+        elif monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """write the buffered occurances to sqlite in one transaction"""
+        if self.pending:
+            self.cursor.executemany(self.UPSERT_SQL, self.pending.items())
+            for word in self.pending_deletes:
+                self.insert_deletes(word)
+            self.conn.commit()
+            self.pending.clear()
+            self.pending_deletes = []
+        self.pending_count = 0
+        self.last_flush = monotonic()
+
+    def add(self, word, occurances=1):
+        if word in self.words:
+            self.add_occurance(word)
+            return False
+        self.words[word] = occurances
+        if self.delete_index:
+            for deletion, _ in self.delete_records(word):
+                self.deletes[deletion].add(word)
+        if self.keep_deletes:
+            self.pending_deletes.append(word)
+        self.index_word(word)
+        self.buffer(word, occurances)
+        self.version += 1
+        return True
+
+    def add_counts(self, counts, words_scanned=None, bigrams=None):
+        new_words = super(CachedDictionary, self).add_counts(
+            counts, words_scanned, bigrams)
+        for word, occurances in counts.items():
+            self.words[word] = self.words.get(word, 0) + occurances
+        for pair, occurances in (bigrams or {}).items():
+            self.bigrams[pair] = self.bigrams.get(pair, 0) + occurances
+        if self.delete_index:
+            for word in new_words:
+                for deletion, _ in self.delete_records(word):
+                    self.deletes[deletion].add(word)
+        return new_words
+
+    def all_words(self):
+        return list(self.words)
+
+    def items(self):
+        return list(self.words.items())
+
+    def all_skips(self):
+        return list(self.skips)
+
+    def bigram_items(self):
+        return [
+            (first, second, occurances)
+            for (first, second), occurances in self.bigrams.items()]
+
+    def lookup_bigrams(self, pairs):
+        index = self.bigrams
+        return {pair: index[pair] for pair in pairs if pair in index}
+
+    def similar_words(self, word, max_distance=1):
+        if not self.delete_index:
+            raise DictionaryError("delete index is not enabled")
+        if max_distance > self.DELETE_DISTANCE:
+            raise ValueError(
+                "max_distance can't exceed {}".format(self.DELETE_DISTANCE))
+        found = set()
+        for deletion in delete_neighborhood(word, max_distance):
+            for candidate in self.deletes.get(deletion, ()):
+                if len(candidate) - len(deletion) <= max_distance:
+                    found.add(candidate)
+        return found
+
+    def __getitem__(self, word):
+        if not isinstance(word, str):
+            raise TypeError("key should be a string")
+        try:
+            return WordRecord(word, self.words[word])
+        except KeyError:
+            raise KeyError("'{}' not found".format(word))
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def lookup_many(self, words):
+        index = self.words
+        return {word: index[word] for word in words if word in index}
+
+    def add_occurance(self, word):
+        word = word.lower()
+        if word not in self.words:
+            return
+        self.words[word] += 1
+        self.buffer(word, 1)
+
+    def in_skips(self, word):
+        return word in self.skips
+
+    def add_skip(self, word):
+        super(CachedDictionary, self).add_skip(word)
+        self.skips.add(word)
+
+
+class SharedDictionary(Dictionary):
+    """Dictionary that several threads and processes can use on one file at
+    the same time.  The file is switched to WAL journaling so reads don't
+    wait for writes, each thread gets its own connection from a pool, and
+    occurance increments are buffered and written as additive updates, so
+    increments of the same word by different writers all count."""
+
+    shared = True
+
+    INCREMENT_SQL = \
+        "UPDATE words SET occurances = occurances + ? WHERE word = ?"
+
+    def __init__(
+            self,
+            db_file,
+            delete_index=False,
+            flush_threshold=1000,
+            timeout=30.0):
+        """timeout is how many seconds a write waits for another writer"""
+        if db_file == ':memory:':
+            raise DictionaryError("a shared dictionary needs a file")
+        self.flush_threshold = flush_threshold
+        self.timeout = timeout
+        self.lock = RLock()
+        self.local = local()
+        self.connections = []
+        self.pending = Counter()
+        self.pending_count = 0
+        super(SharedDictionary, self).__init__(db_file, delete_index)
+
+    def open_connection(self, snapshot):
+        if snapshot:
+            raise DictionaryError("a shared dictionary can't be a snapshot")
+        # connections are opened per thread on first use
+
+    def new_connection(self):
+        # each thread uses only its own connection, close() may run in
+        # another thread though
+        conn = connect(
+            self.db_file, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            self.connections.append(conn)
+        return conn
+
+    @property
+    def conn(self):
+        try:
+            return self.local.conn
+        except AttributeError:
+            self.local.conn = self.new_connection()
+            return self.local.conn
+
+    @property
+    def cursor(self):
+        try:
+            return self.local.cursor
+        except AttributeError:
+            self.local.cursor = self.conn.cursor()
+            return self.local.cursor
+
+    def close(self):
+        """flushes and closes the connections of every thread"""
+        self.flush()
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+            self.local = local()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+        return super(SharedDictionary, self).__exit__(
+            exc_type, exc_val, exc_tb)
+
+    def flush(self):
+        """writes the buffered increments in one transaction"""
+        with self.lock:
+            pending = self.pending
+            self.pending = Counter()
+            self.pending_count = 0
+        if not pending:
+            self.conn.commit()
+            return
+        try:
+            with self.conn:
+                self.cursor.executemany(
+                    self.INCREMENT_SQL,
+                    [(count, word) for word, count in pending.items()])
+        except Exception:
+            with self.lock:
+                self.pending.update(pending)
+            raise
+
+    def add_occurance(self, word):
+        with self.lock:
+            self.pending[word.lower()] += 1
+            self.pending_count += 1
+            full = self.pending_count >= self.flush_threshold
+        if full:
+            self.flush()
@@ -1,17 +1,63 @@
 #!/usr/bin/env python3
 
+from argparse import ArgumentParser
+from collections import Counter
 from csv import DictReader
 
-ALL_WORDS = set()
-WORDS_BY_LINE = []
-
-with open('TypesAlphabetically.csv', 'r') as inFile:
-    reader = DictReader(inFile)
-    for i, row in enumerate(reader):
-        wordsOnLine = list(
-                filter(
-                    lambda x: len(x)>0,
-                    row['type'].split(' ')))
-        print(wordsOnLine)
-        if i > 200:
-            break
+from cleanCrashData import ModelNumberClassifier
+from dictionary import Dictionary
+
+
+def unknownManufacturers(classifier, filepath, field):
+    """counts the first words of the types whose manufacturer isn't known"""
+    counts = Counter()
+    with open(filepath, 'r', newline='') as csvFile:
+        for row in DictReader(csvFile):
+            aircraftType = row.get(field, '')
+            if '/' in aircraftType:
+                continue
+            manufacturer, model, variant = classifier.classify(aircraftType)
+            words = model.split()
+            if not manufacturer and words:
+                counts[words[0]] += 1
+    return counts
+
+
+def main(args):
+    with Dictionary(args.dictionary) as dictionary:
+        for name in args.add or []:
+            dictionary.add_manufacturer(name)
+        classifier = ModelNumberClassifier.from_dictionary(dictionary)
+    if args.input_file is None:
+        return
+    counts = unknownManufacturers(classifier, args.input_file, args.field)
+    for word, count in counts.most_common(args.limit):
+        print('{},{}'.format(count, word))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Add manufacturers to the dictionary and list the '
+            'first words of types with no known manufacturer')
+    parser.add_argument(
+        '-d', '--dictionary',
+        default='aircraft.sqlite',
+        help="dictionary holding the manufacturers")
+    parser.add_argument(
+        '-a', '--add',
+        action='append',
+        metavar='NAME',
+        help="manufacturer to add, can be repeated")
+    parser.add_argument(
+        '-f', '--field',
+        default='Type',
+        help="field holding the aircraft types")
+    parser.add_argument(
+        '-n', '--limit',
+        type=int,
+        help="list only the most common words")
+    parser.add_argument(
+        'input_file',
+        nargs='?',
+        help="crash data to look for unknown manufacturers in")
+    main(parser.parse_args())
@@ -0,0 +1,96 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from json import dump
+from sys import stderr
+from time import perf_counter
+
+
+class Instrumentation(object):
+    """Counters and timers for a cleaning run, reported as a periodic
+    progress line and a final JSON report"""
+
+    enabled = True
+
+    def __init__(self, progress_every=0, out_file=stderr):
+        self.progress_every = progress_every
+        self.out_file = out_file
+        self.counters = Counter()
+        self.timers = defaultdict(float)
+        self.started = perf_counter()
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    @contextmanager
+    def timer(self, name):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += perf_counter() - started
+
+    def count_sql(self, statement):
+        self.counters['sql_statements'] += 1
+
+    def trace_dictionary(self, dictionary):
+        """counts every SQL statement the dictionary's connection runs"""
+        dictionary.conn.set_trace_callback(self.count_sql)
+
+    def row_done(self):
+        self.counters['rows'] += 1
+        if self.progress_every and \
+                self.counters['rows'] % self.progress_every == 0:
+            self.out_file.write(self.progress_line() + '\n')
+            self.out_file.flush()
+
+    def rows_per_second(self):
+        elapsed = perf_counter() - self.started
+        if elapsed <= 0:
+            return 0
+        return self.counters['rows'] / elapsed
+
+    def progress_line(self):
+        return 'rows {} ({:.0f}/s) spellchecks {} memo hits {} sql {}'.format(
+            self.counters['rows'],
+            self.rows_per_second(),
+            self.counters['spellchecks'],
+            self.counters['memo_hits'],
+            self.counters['sql_statements'])
+
+    def report(self):
+        return {
+            'seconds': round(perf_counter() - self.started, 6),
+            'rows_per_second': round(self.rows_per_second(), 1),
+            'counters': dict(self.counters),
+            'timers': {
+                name: round(seconds, 6)
+                for name, seconds in sorted(self.timers.items())},
+        }
+
+    def write_report(self, path):
+        with open(path, 'w') as report_file:
+            dump(self.report(), report_file, indent=2)
+
+
+class NullInstrumentation(object):
+    """Stands in for Instrumentation when it is disabled, every call does
+    nothing"""
+
+    enabled = False
+
+    null_timer = nullcontext()
+
+    def count(self, name, amount=1):
+        pass
+
+    def timer(self, name):
+        return self.null_timer
+
+    def trace_dictionary(self, dictionary):
+        pass
+
+    def row_done(self):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
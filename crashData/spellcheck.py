@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
 from cmd import Cmd
-from collections import Counter
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from csv import DictReader, DictWriter
+from functools import lru_cache
+from heapq import nlargest
+from itertools import chain
+from math import exp, log
+from operator import itemgetter
 from re import compile as re_compile
 from sqlite3 import connect
 from statistics import mean
@@ -12,8 +18,9 @@ from sys import stderr
 # from nltk import word_tokenize
 
 from dictionary import Dictionary
+from instrumentation import NULL_INSTRUMENTATION
 from tokenizer import Tokenizer
-from subsequence_group import subsequence_group
+from subsequence_group import subsequence_views
 
 
 PUNCTUATION = set(punctuation)
@@ -42,90 +49,134 @@ def split_generator(word, validate=True):
         validate_word(word)
     if len(word) == 1:
         raise ValueError("Can't split a 1 character word")
-    for i in range(len(word) - 1):
-        yield (word[:i+1], word[i+1:])
-        
+    for i in range(1, len(word)):
+        yield word[:i], word[i:]
+
+
+# The edit generators build each candidate from slices of word in one
+# concatenation.  With batched=True they yield lists of candidates (one per
+# position for replaces and inserts) for bulk membership tests.
+
+def batches_or_candidates(batches, batched):
+    if batched:
+        return batches
+    return chain.from_iterable(batches)
 
-def delete_generator(word, validate=True):
+
+def delete_generator(word, validate=True, batched=False):
     if validate:
         validate_word(word)
     if len(word) == 1:
-        raise StopIteration
-    for i in range(len(word)):
-        if i ==0:
-            yield word[1:]
-            continue
-        yield word[:i] + word[i+1:] 
+        batches = []
+    else:
+        batches = [[word[:i] + word[i+1:] for i in range(len(word))]]
+    return batches_or_candidates(batches, batched)
  
  
-def transpose_generator(word, validate=True):
+def transpose_generator(word, validate=True, batched=False):
     if validate:
         validate_word(word)
-        
     if len(word) == 1:
-        yield word
-        
-    chars = [c for c in word]
-
-    for i in range(len(word)-1):
-        # swap 2 characters
-        temp = chars[i]
-        chars[i] = chars[i+1]
-        chars[i+1] = temp
-        
-        # yield the result
-        yield ''.join(chars)
-        
-        # swap the characters back
-        temp = chars[i]
-        chars[i] = chars[i+1]
-        chars[i+1] = temp
+        batches = [[word]]
+    else:
+        batches = [[
+            word[:i] + word[i+1] + word[i] + word[i+2:]
+            for i in range(len(word) - 1)]]
+    return batches_or_candidates(batches, batched)
 
 
 def validate_alphabet(alphabet):
     if alphabet is None:
         raise ValueError("alphabet can't be None")
         
-    if not isinstance(alphabet, set):
-        raise ValueError("alphabet must be a set")
+    if not isinstance(alphabet, (set, frozenset, tuple)):
+        raise ValueError("alphabet must be a set or a sorted tuple")
         
-    if alphabet == set():
+    if not alphabet:
         raise ValueError("alphabet can't be empty set")    
 
 
-def replace_generator(word, alphabet, validate=True):
+@lru_cache(maxsize=16)
+def sorted_alphabet_of(alphabet):
+    return tuple(sorted(alphabet))
+
+
+def sorted_alphabet(alphabet):
+    """alphabet as a sorted tuple, tuples are assumed to be sorted already"""
+    if isinstance(alphabet, tuple):
+        return alphabet
+    return sorted_alphabet_of(frozenset(alphabet))
+
+
+def replace_batches(word, alphabet):
+    for i, replaced in enumerate(word):
+        prefix = word[:i]
+        suffix = word[i+1:]
+        yield [prefix + c + suffix for c in alphabet if c != replaced]
+
+
+def replace_generator(word, alphabet, validate=True, batched=False):
     if validate:
         validate_word(word)
-               
     validate_alphabet(alphabet)
+    return batches_or_candidates(
+        replace_batches(word, sorted_alphabet(alphabet)), batched)
 
-    mutable_word = list(word)
-    for i in range(len(mutable_word)):
-        for c in alphabet:
-            
-            temp = mutable_word[i] 
-            if temp == c:
-                continue
-                
-            mutable_word[i] = c
-            candidate = ''.join(mutable_word) 
-            yield candidate
-            mutable_word[i] = temp
-        
 
-def inserts_generator(word, alphabet, validate=True):
+def insert_batches(word, alphabet):
+    for i in range(len(word) + 1):
+        prefix = word[:i]
+        suffix = word[i:]
+        yield [prefix + c + suffix for c in alphabet]
+
+
+def inserts_generator(word, alphabet, validate=True, batched=False):
     if validate:
         validate_word(word)
-    
     validate_alphabet(alphabet)
-    
-    mutable_word = list(word)
-    for i in range(len(mutable_word) + 1):
-        for c in alphabet:
-            mutable_word.insert(i, c)
-            candidate = ''.join(mutable_word)
-            mutable_word.pop(i)
-            yield candidate
+    return batches_or_candidates(
+        insert_batches(word, sorted_alphabet(alphabet)), batched)
+
+
+def edit_distance(word1, word2):
+    """Number of inserts, deletes, replaces and adjacent transposes needed to
+    turn word1 into word2 (optimal string alignment distance)"""
+    previous_row = None
+    row = list(range(len(word2) + 1))
+    for i in range(1, len(word1) + 1):
+        before_previous_row, previous_row = previous_row, row
+        row = [i] + [0] * len(word2)
+        for j in range(1, len(word2) + 1):
+            cost = 0 if word1[i-1] == word2[j-1] else 1
+            row[j] = min(
+                previous_row[j] + 1,
+                row[j-1] + 1,
+                previous_row[j-1] + cost)
+            if i > 1 and j > 1 and word1[i-1] == word2[j-2] \
+                    and word1[i-2] == word2[j-1]:
+                row[j] = min(row[j], before_previous_row[j-2] + 1)
+    return row[-1]
+
+def word_units(tokens):
+    """Yields (None, the tokens before the first word), then (word, the
+    tokens up to the next word) for each word token"""
+    word = None
+    separators = []
+    for token in tokens:
+        if token.isalpha():
+            yield word, separators
+            word = token
+            separators = []
+        else:
+            separators.append(token)
+    yield word, separators
+
+
+def last_word(word_or_words):
+    """the last of the words check() returned, None for None"""
+    if word_or_words is None:
+        return None
+    return word_or_words.rsplit(' ', 1)[-1]
 
 # https://norvig.com/spell-correct.html
 
@@ -150,6 +201,7 @@ class InteractiveReplace(Cmd):
         if not self.dictionary.add(self.word_in):
             raise RuntimeError(
                 "Unable to add {} to dictionary".format(self.word_in))
+        self.spellchecker.add_characters(self.word_in)
         self.word_out = self.word_in
         self.action = 'add'
         return True
@@ -205,16 +257,19 @@ class InteractiveReplace(Cmd):
         words = word_out.split()
         if len(words) == 1:
             self.dictionary.add(word_out)
+            self.spellchecker.add_characters(word_out)
             return self.correct(word_out)
             
         confirm = self.get_input("Treat '{}' as {} words? (y/n):" \
             .format(word_out, len(words)))
         if confirm.lower() != 'y':
             self.dictionary.add(word_out)
+            self.spellchecker.add_characters(word_out)
             return self.correct(word_out)
             
         for word in words:
             self.dictionary.add(word)
+            self.spellchecker.add_characters(word)
         return self.correct(word_out)
             
             
@@ -226,18 +281,51 @@ class SpellChecker:
     default_alphabet = ascii_lowercase
     roman_numeral_characters = set('MCLXVI')
 
+    # pseudo occurances of a first word, shared out by word frequency, that
+    # smooth the bigram probabilities context_scored() uses
+    BIGRAM_PRIOR = 1.0
+
     def __init__(
             self, 
             dictionary,
             interactive=False,
-            alphabet=default_alphabet):
+            alphabet=default_alphabet,
+            confidence_threshold=0.5,
+            top_k=5,
+            memo_size=10000,
+            max_distance=2,
+            instrumentation=NULL_INSTRUMENTATION,
+            context_weight=0.5,
+            candidate_limit=None):
         
         self.dictionary = dictionary 
         self.interactive = interactive
-        self.alphabet = set(alphabet)
+        # edits with any character of a dictionary word can lead to one
+        self.alphabet = set(alphabet) | dictionary.characters()
+        self.confidence_threshold = confidence_threshold
+        self.top_k = top_k
+        self.max_distance = max_distance
+        # exponent of the context probability in a candidate's score, that of
+        # its word probability being 1 - context_weight, see
+        # context_scored().  0 ranks by word frequency alone
+        self.context_weight = context_weight
+        # stop looking for corrections once this many were found, None
+        # ranks every candidate
+        self.candidate_limit = candidate_limit
+        self.instrumentation = instrumentation
         self.words_not_found = Counter()
+        # inside recording(), the dictionary words whose occurances the
+        # checks would have counted
+        self.recorded = None
         self.skips = set()
         self.skip_next = False
+        # LRU memo of (word, next_word, previous_word) -> (result, word
+        # counted, whether the word was counted in words_not_found)
+        self.memo = OrderedDict()
+        self.memo_size = memo_size
+        self.memo_version = dictionary.version
+        self.memo_hits = 0
+        self.memo_misses = 0
 
     @staticmethod
     def one_edit_away(word):
@@ -251,52 +339,229 @@ class SpellChecker:
     def is_roman_numeral(self, word):
         return not bool(set(word) - self.roman_numeral_characters)
         
-    def find_candidates(self, word, number_candidates=1):
-        """yields a tuple of probability, word1, word2"""        
-        for candidate in inserts_generator(word, self.alphabet):
-            if candidate not in self.dictionary:
-                continue
-            print("insert", candidate)
-            probability = self.dictionary.probability(candidate)
-            yield probability, candidate, None        
-        
-        if len(word) <= 1:
-            raise StopIteration()
-            
-        for candidate, candidate2 in split_generator(word):
-            if candidate not in self.dictionary:
-                continue
-            if candidate2 not in self.dictionary:
-                continue
-            print("Split", candidate, candidate2)
-            
-            total = self.dictionary.probability(candidate)
-            total += self.dictionary.probability(candidate2) 
-            probability = total / 2.0
-            yield probability, candidate, candidate2
-            
-        for candidate in delete_generator(word):
-            if candidate not in self.dictionary:
-                continue
-            print("delete", candidate)
-            probability = self.dictionary.probability(candidate)
+    def indexed_candidates(self, word, max_distance=1):
+        """yields a tuple of probability, word1, None for each dictionary word
+        within max_distance edits of word using the dictionary's delete
+        index"""
+        with self.instrumentation.timer('find_candidates.similar_words'):
+            candidates = [
+                candidate
+                for candidate in self.dictionary.similar_words(
+                    word, max_distance)
+                if candidate != word
+                and edit_distance(word, candidate) <= max_distance
+            ]
+        with self.instrumentation.timer('find_candidates.lookup'):
+            found = self.dictionary.lookup_many(candidates)
+        for candidate in candidates:
+            probability = self.dictionary.occurance_probability(
+                found[candidate])
             yield probability, candidate, None
-                
-        for candidate in transpose_generator(word):
-            if candidate not in self.dictionary:
+
+    def split_candidates(self, word, prefixes=None):
+        """yields a tuple of probability, word1, word2.  With prefixes, splits
+        whose first word isn't among them aren't looked up."""
+        splits = [
+            (candidate, candidate2)
+            for candidate, candidate2 in split_generator(word)
+            if prefixes is None or candidate in prefixes]
+        found = self.dictionary.lookup_many(chain.from_iterable(splits))
+        for candidate, candidate2 in splits:
+            if candidate not in found or candidate2 not in found:
                 continue
-            print("transpose", candidate)
-            probability = self.dictionary.probability(candidate)
-            yield probability, candidate, None
-            
-        for candidate in replace_generator(word, self.alphabet):
-            if candidate not in self.dictionary:
+            total = self.dictionary.occurance_probability(found[candidate])
+            total += self.dictionary.occurance_probability(found[candidate2])
+            yield total / 2.0, candidate, candidate2
+
+    def edit_neighborhood(self, word):
+        """returns the set of strings one insert, delete, transpose or replace
+        away from word"""
+        alphabet = sorted_alphabet(self.alphabet)
+        neighborhood = set()
+        batches = [inserts_generator(word, alphabet, False, True)]
+        if len(word) > 1:
+            batches.append(delete_generator(word, False, True))
+            batches.append(transpose_generator(word, False, True))
+            batches.append(replace_generator(word, alphabet, False, True))
+        for batch in chain.from_iterable(batches):
+            neighborhood.update(batch)
+        return neighborhood
+
+    def distance2_candidates(self, word, exclude, prefixes, alphabet):
+        """yields a tuple of probability, word1, None for each dictionary word
+        two edits away from word that isn't in exclude"""
+        neighborhood = set()
+        # the second edit can repair the character the first one changed, so
+        # the first is only kept from going past the dictionary prefix of word
+        first = set()
+        for edit_type in self.edit_types(word):
+            if edit_type != 'split':
+                first.update(self.pruned_edits(
+                    word, edit_type, prefixes, alphabet, extend=False))
+        for edit in first:
+            if not edit:
                 continue
-            print("replace", candidate)
-            probability = self.dictionary.probability(candidate)
+            for edit_type in self.edit_types(edit):
+                if edit_type != 'split':
+                    neighborhood.update(self.pruned_edits(
+                        edit, edit_type, prefixes, alphabet))
+        neighborhood -= exclude
+        neighborhood.discard(word)
+        found = self.dictionary.lookup_many(neighborhood)
+        for candidate, occurances in found.items():
+            probability = self.dictionary.occurance_probability(occurances)
             yield probability, candidate, None
-                
-    def check(self, word, next_word=None):
+
+    def trie_candidates(self, word, max_distance=1):
+        """yields a tuple of probability, word1, None for each dictionary word
+        within max_distance edits of word by searching the dictionary's
+        trie"""
+        with self.instrumentation.timer('find_candidates.trie'):
+            candidates = [
+                candidate
+                for candidate, distance in self.dictionary.words_within(
+                    word, max_distance)
+                if distance > 0
+            ]
+        with self.instrumentation.timer('find_candidates.lookup'):
+            found = self.dictionary.lookup_many(candidates)
+        for candidate in candidates:
+            probability = self.dictionary.occurance_probability(
+                found[candidate])
+            yield probability, candidate, None
+
+    def find_candidates(
+            self,
+            word,
+            number_candidates=None,
+            max_distance=1,
+            threshold=0.0):
+        """Lazily yields tuples of probability, word1, word2, stopping once
+        number_candidates of them with a probability of at least threshold
+        were yielded (all of them when number_candidates is None).  When the
+        dictionary has a trie any max_distance can be searched, otherwise at
+        most 2"""
+        candidates = self.all_candidates(word, max_distance)
+        if number_candidates is None:
+            yield from candidates
+            return
+        found = 0
+        for candidate in candidates:
+            yield candidate
+            if candidate[0] >= threshold:
+                found += 1
+                if found >= number_candidates:
+                    return
+
+    def all_candidates(self, word, max_distance=1):
+        if self.dictionary.trie is not None:
+            yield from self.trie_candidates(word, max_distance)
+            if len(word) > 1:
+                yield from self.split_candidates(word)
+            return
+
+        if self.dictionary.delete_index:
+            yield from self.indexed_candidates(word, max_distance)
+            if len(word) > 1:
+                yield from self.split_candidates(word)
+            return
+
+        yield from self.generated_candidates(word, max_distance)
+
+    def prefixes(self):
+        """the prefixes of the dictionary words, anything supporting in,
+        which the dictionary keeps up to date as words are added"""
+        return self.dictionary.prefixes()
+
+    def add_characters(self, word):
+        """widens the alphabet with the characters of a word added to the
+        dictionary"""
+        self.alphabet |= set(word)
+
+    def pruned_edits(self, word, edit, prefixes, alphabet, extend=True):
+        """Yields the strings one edit of type edit ('transpose', 'delete',
+        'replace' or 'insert') away from word that start with a dictionary
+        prefix, alphabet being sorted_alphabet(self.alphabet).  An edit at
+        position i keeps word[:i], so positions past the longest prefix of
+        word in the dictionary are never tried, and with extend a string is
+        only built once the edited character extends a prefix.  Without it
+        one more position is tried, for a second edit to follow."""
+        reach = 0
+        while reach < len(word) and word[:reach + 1] in prefixes:
+            reach += 1
+        if not extend:
+            # a second edit can still change the character after the prefix
+            reach += 1
+        positions = range(min(reach, len(word) - 1) + 1)
+        if edit == 'transpose':
+            for i in positions:
+                if i + 1 < len(word) and (
+                        not extend or word[:i] + word[i+1] in prefixes):
+                    yield word[:i] + word[i+1] + word[i] + word[i+2:]
+        elif edit == 'delete':
+            for i in positions:
+                if not extend or i + 1 == len(word) \
+                        or word[:i] + word[i+1] in prefixes:
+                    yield word[:i] + word[i+1:]
+        elif edit == 'replace':
+            for i in positions:
+                for c in alphabet:
+                    if c != word[i] and (
+                            not extend or word[:i] + c in prefixes):
+                        yield word[:i] + c + word[i+1:]
+        elif edit == 'insert':
+            for i in range(min(reach, len(word)) + 1):
+                for c in alphabet:
+                    if not extend or word[:i] + c in prefixes:
+                        yield word[:i] + c + word[i:]
+        else:
+            raise ValueError("unknown edit '{}'".format(edit))
+
+    # edit types the generator path tries, cheapest and most likely first
+    EDIT_ORDER = ('transpose', 'delete', 'split', 'replace', 'insert')
+
+    def edit_types(self, word):
+        """single characters can only have characters inserted"""
+        return self.EDIT_ORDER if len(word) > 1 else ('insert',)
+
+    def generated_candidates(self, word, max_distance=1):
+        """yields a tuple of probability, word1, word2 for each dictionary
+        word, or pair of words, an edit away from word, one edit type at a
+        time in EDIT_ORDER, then those two edits away if max_distance > 1"""
+        prefixes = self.prefixes()
+        alphabet = sorted_alphabet(self.alphabet)
+        seen = {word}
+        for edit in self.edit_types(word):
+            with self.instrumentation.timer('find_candidates.' + edit):
+                if edit == 'split':
+                    batch = list(self.split_candidates(word, prefixes))
+                else:
+                    edits = [
+                        candidate
+                        for candidate in self.pruned_edits(
+                            word, edit, prefixes, alphabet)
+                        if candidate not in seen]
+                    found = self.dictionary.lookup_many(edits)
+                    batch = []
+                    for candidate in edits:
+                        if candidate not in found or candidate in seen:
+                            continue
+                        seen.add(candidate)
+                        probability = self.dictionary.occurance_probability(
+                            found[candidate])
+                        batch.append((probability, candidate, None))
+            yield from batch
+
+        if max_distance > 1:
+            seen.discard(word)
+            yield from self.distance2_candidates(
+                word, seen, prefixes, alphabet)
+
+    def clear_memo(self):
+        self.memo.clear()
+        self.memo_version = self.dictionary.version
+
+    def check(self, word, next_word=None, previous_word=None):
         
         if self.skip_next:
             self.skip_next = False
@@ -304,63 +569,119 @@ class SpellChecker:
             
         if not word:
             return word
+
+        if self.memo_version != self.dictionary.version:
+            # words or skips were added, earlier decisions may be stale
+            self.clear_memo()
+
+        self.instrumentation.count('spellchecks')
+        if not self.context_weight:
+            previous_word = None
+        key = (word, next_word, previous_word)
+        if key in self.memo:
+            self.memo_hits += 1
+            self.instrumentation.count('memo_hits')
+            self.memo.move_to_end(key)
+            word_or_words, counted, not_found = self.memo[key]
+            if counted is not None:
+                self.count_occurance(counted)
+            elif not_found:
+                self.words_not_found.update([word])
+            return word_or_words
+
+        self.memo_misses += 1
+        not_found_before = self.words_not_found[word]
+        word_or_words, counted = self.resolve(word, next_word, previous_word)
+        if counted is not None:
+            self.count_occurance(counted)
+        not_found = self.words_not_found[word] != not_found_before
+        self.memo[key] = word_or_words, counted, not_found
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+        return word_or_words
+
+    def count_occurance(self, word):
+        if self.recorded is None:
+            self.dictionary.add_occurance(word)
+        else:
+            self.recorded.append(word)
+
+    @contextmanager
+    def recording(self):
+        """Checks in the block count nothing.  Yields a list and a Counter
+        that are filled with the dictionary words whose occurances they
+        would have counted and the words they didn't find, to replay() each
+        time the same text is checked again."""
+        words_not_found = self.words_not_found
+        counted = self.recorded = []
+        not_found = self.words_not_found = Counter()
+        try:
+            yield counted, not_found
+        finally:
+            self.recorded = None
+            self.words_not_found = words_not_found
+
+    def replay(self, counted, not_found):
+        """counts what checks in recording() would have counted"""
+        for word in counted:
+            self.count_occurance(word)
+        self.words_not_found.update(not_found)
+
+    def resolve(self, word, next_word=None, previous_word=None):
+        """returns the checked word or words and the dictionary word whose
+        occurance should be counted, if any"""
             
         new_characters = set(word.lower()) - self.alphabet
         if new_characters:
             self.alphabet |= new_characters
             
         if word in PUNCTUATION:
-            return word
+            return word, None
             
         if word in self.dictionary:
-            self.dictionary.add_occurance(word)
-            return word
+            return word, word
         
         if next_word is not None:
             combined = word + next_word
             if combined in self.dictionary:
-                self.dictionary.add_occurance(combined)
-                return combined
+                return combined, combined
             
         if self.is_roman_numeral(word):
-            return word
+            return word, None
             
+        if self.dictionary.in_skips(word):
+            return word, None
+
         if self.interactive:
-            if self.dictionary.in_skips(word):
-                return word
-            return self.interactive_replace(word)
+            return self.interactive_replace(word), None
             
-        return self.automatic_replace(word)
+        return self.automatic_replace(word, previous_word, next_word), None
 
     def check_text(self, text_in, tokenizer):
         """
-        This method yields a series of tokens (words, punctuation, etc)
+        This method yields a series of tokens (words, punctuation, etc) in
+        the order of text_in.  Each word is checked with the word after it
+        and, unless punctuation separates them, the checked word before it
+        as context.  A word joined onto the one before it is dropped along
+        with the whitespace between them.
         """
-        word_buffer = []
-        for token in tokenizer.tokenize(text_in):
-            if not token.isalpha():
-                yield token
-                continue
-                
-            if len(word_buffer) < 2:
-                word_buffer.append(token)
-                
-                # at this point there are either 1 or 2 words in the buffer
-                if len(word_buffer) < 2:
-                    continue
-                
-            word, next_word = word_buffer
-            word_buffer.pop(0)
-        
-            word_or_words = self.check(word, next_word)
-            if word_or_words is not None:
-                yield word_or_words
-
-        # process the last word in the buffer
-        if word_buffer:
-            word_or_words = self.check(word_buffer[0])
-            if word_or_words is not None:
-                yield word_or_words
+        previous_word = None
+        for window in subsequence_views(
+                word_units(tokenizer.tokenize(text_in)), 2, pad=True):
+            (word, separators), next_unit = window[0], window[1]
+            if word is not None:
+                next_word = next_unit[0] if next_unit is not None else None
+                word_or_words = self.check(word, next_word, previous_word)
+                if word_or_words is not None:
+                    yield word_or_words
+                    previous_word = last_word(word_or_words)
+                    if next_word is not None \
+                            and word_or_words == word + next_word:
+                        self.skip_next = True
+                        separators = []
+            if any(not token.isspace() for token in separators):
+                previous_word = None
+            yield from separators
             
     def interactive_replace(self, word):
         cmd = InteractiveReplace(word, self)
@@ -369,20 +690,101 @@ class SpellChecker:
             self.skips.add(word)
         return cmd.word_out
     
-    def automatic_replace(self, word):
-        raise NotImplementedError("Implement automatic_replace")
-        # print("{} not found".format(word))
-        # self.words_not_found.update([word])
-# 
-        # for candidate in self.find_candidates(word):
-            # print(candidate)
-# 
-        # "Most probable spelling correction for word."
-        # return word
-
-
-
-    # def dump_words_not_found
+    def rank_candidates(
+            self, word, max_distance=1, previous_word=None, next_word=None):
+        """returns the top_k candidates for word, most probable first, scored
+        in the context of previous_word and next_word if given"""
+        candidates = self.find_candidates(
+            word, self.candidate_limit, max_distance)
+        if self.context_weight and (previous_word or next_word):
+            candidates = self.context_scored(
+                list(candidates), previous_word, next_word)
+        return nlargest(self.top_k, candidates, key=itemgetter(0))
+
+    def context_scored(self, candidates, previous_word, next_word):
+        """Yields the (probability, word1, word2) candidates rescored as
+            probability ** (1 - context_weight) * context ** context_weight
+        context being the geometric mean of the smoothed P(second | first)
+        of the bigrams each candidate forms with previous_word and
+        next_word,
+            (occurances of the bigram + BIGRAM_PRIOR * P(second))
+                / (occurances of first + BIGRAM_PRIOR)
+        Both are probabilities of a word, so context_weight trades one off
+        against the other, and an unseen bigram falls back to the word
+        frequency of second.  Bigrams ending in a word that isn't in the
+        dictionary say nothing about the candidates and are left out.  The
+        bigrams and words are looked up in one batch each."""
+        contexts = []
+        for _, candidate, candidate2 in candidates:
+            words = [candidate] if candidate2 is None \
+                else [candidate, candidate2]
+            contexts.append([
+                (first, second)
+                for first, second in zip(
+                    [previous_word] + words, words + [next_word])
+                if first and second])
+        with self.instrumentation.timer('find_candidates.context'):
+            pairs = set(chain.from_iterable(contexts))
+            bigrams = self.dictionary.lookup_bigrams(pairs)
+            occurances = self.dictionary.lookup_many(
+                chain.from_iterable(pairs))
+
+        def smoothed(pair):
+            first, second = pair
+            prior = self.BIGRAM_PRIOR * self.dictionary.occurance_probability(
+                occurances.get(second, 0))
+            return (bigrams.get(pair, 0) + prior) \
+                / (occurances.get(first, 0) + self.BIGRAM_PRIOR)
+
+        weight = self.context_weight
+        for (probability, candidate, candidate2), pairs in zip(
+                candidates, contexts):
+            pairs = [pair for pair in pairs if pair[1] in occurances]
+            if not pairs or probability <= 0:
+                yield probability, candidate, candidate2
+                continue
+            context = exp(mean(log(smoothed(pair)) for pair in pairs))
+            yield probability ** (1 - weight) * context ** weight, \
+                candidate, candidate2
 
+    @staticmethod
+    def confidence(ranked):
+        """share of the ranked candidates' probability held by the first, or
+        0 if it doesn't beat the second"""
+        total = sum(probability for probability, _, _ in ranked)
+        if total <= 0:
+            return 0
+        if len(ranked) > 1 and ranked[0][0] <= ranked[1][0]:
+            # a tie would be broken by the order the candidates were found in
+            return 0
+        return ranked[0][0] / total
+
+    def automatic_replace(self, word, previous_word=None, next_word=None):
+        """Replaces word with its most probable correction.  Each further
+        edit distance, up to self.max_distance, is only searched when the
+        closer ones have no confident winner.  Words without a confident
+        correction are counted in words_not_found and returned unchanged.
+        previous_word and next_word are the context candidates are ranked
+        in.  A dictionary that hasn't been trained has no occurance
+        counts to rank by, so it never gives a confident correction."""
+        if self.dictionary.words_scanned <= 0:
+            self.words_not_found.update([word])
+            return word
+        for max_distance in range(1, self.max_distance + 1):
+            ranked = self.rank_candidates(
+                word, max_distance, previous_word, next_word)
+            if not ranked:
+                continue
+            if self.confidence(ranked) < self.confidence_threshold:
+                continue
+            _, candidate, candidate2 = ranked[0]
+            if candidate2 is None:
+                return candidate
+            return candidate + ' ' + candidate2
 
+        self.words_not_found.update([word])
+        return word
 
+    def dump_words_not_found(self, out_file):
+        for word, count in self.words_not_found.most_common():
+            out_file.write('{},{}\n'.format(count, word))
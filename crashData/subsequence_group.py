@@ -1,25 +1,80 @@
+from collections import deque
 
-def subsequence_group(iterable, group_length):
-    
-    group_out = []
-    
+
+def subsequence_group(iterable, group_length, pad=False, fill=None):
+    """Yields a tuple of each group_length consecutive items of iterable.
+    With pad, the groups go on past the end, filled up with fill, until every
+    item has started a group.  Without it, an iterable of fewer than
+    group_length items gives a single group filled up with fill."""
+    window = deque(maxlen=group_length)
+    for item in iterable:
+        window.append(item)
+        if len(window) == group_length:
+            yield tuple(window)
+
+    if pad:
+        for _ in range(group_length - 1):
+            window.append(fill)
+            if len(window) == group_length:
+                yield tuple(window)
+    elif len(window) < group_length:
+        window.extend([fill] * (group_length - len(window)))
+        yield tuple(window)
+
+
+class RingWindow(object):
+    """Read-only view of the last length items pushed into a ring buffer"""
+
+    __slots__ = ('buffer', 'length', 'pushed')
+
+    def __init__(self, length):
+        self.buffer = [None] * length
+        self.length = length
+        self.pushed = 0
+
+    def push(self, item):
+        self.buffer[self.pushed % self.length] = item
+        self.pushed += 1
+
+    def full(self):
+        return self.pushed >= self.length
+
+    def __len__(self):
+        return min(self.pushed, self.length)
+
+    def __getitem__(self, i):
+        size = len(self)
+        if i < 0:
+            i += size
+        if not 0 <= i < size:
+            raise IndexError("window index out of range")
+        return self.buffer[(self.pushed - size + i) % self.length]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return 'RingWindow({!r})'.format(tuple(self))
+
+
+def subsequence_views(iterable, group_length, pad=False, fill=None):
+    """Yields the same groups as subsequence_group, but as one RingWindow
+    that is moved along instead of a new tuple per group.  A group is only
+    valid until the next one is requested, copy it with tuple() to keep
+    it."""
+    window = RingWindow(group_length)
     for item in iterable:
-        if len(group_out) == group_length:
-            group_out.pop(0)
-            
-        group_out.append(item)
-        
-        if len(group_out) == group_length:
-            yield tuple(group_out)
-            
-    if len(group_out) == group_length:
-        raise StopIteration()
-        
-    # This happens if the iterable has fewer than group_length items.
-    # Pad with None values
-    while len(group_out) < group_length:
-        group_out.append(None) 
-        
-    yield tuple(group_out)
-    
-        
+        window.push(item)
+        if window.full():
+            yield window
+
+    if pad:
+        for _ in range(group_length - 1):
+            window.push(fill)
+            if window.full():
+                yield window
+    elif not window.full():
+        while not window.full():
+            window.push(fill)
+        yield window
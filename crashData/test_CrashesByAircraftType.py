@@ -0,0 +1,122 @@
+from csv import DictWriter, Error as CsvError
+
+from pytest import raises
+
+from CrashesByAircraftType import aggregate, CrashAggregates, \
+    manufacturerOf, TypeCrashes, typeOf
+
+
+ROWS = [
+    {'Type': 'Douglas DC-3', 'Manufacturer': ''},
+    {'Type': 'Zeppelin L-1', 'Manufacturer': ''},
+    {'Type': 'Douglas DC-3', 'Manufacturer': ''},
+    {'Type': 'Douglas C-47', 'Manufacturer': ''},
+    {'Type': 'DH-4', 'Manufacturer': 'De Havilland'},
+]
+
+
+def test_manufacturer_of():
+    assert manufacturerOf(ROWS[0]) == 'Douglas'
+    assert manufacturerOf(ROWS[4]) == 'De Havilland'
+    assert manufacturerOf({'Type': ' '}) == ''
+
+
+def test_type_of():
+    assert typeOf(ROWS[0]) == 'Douglas DC-3'
+    assert typeOf({'Type': 'DC-3', 'Manufacturer': 'Douglas'}) == \
+        'Douglas DC-3'
+
+
+def test_aggregates():
+    aggregates = CrashAggregates().addAll(ROWS)
+    assert aggregates.crashesByType['Douglas DC-3'] == 2
+    assert aggregates.crashesByManufacturer == {
+        'Douglas': 3, 'Zeppelin': 1, 'De Havilland': 1}
+    assert aggregates.typesByManufacturer['Douglas'] == \
+        {'Douglas DC-3', 'Douglas C-47'}
+    assert aggregates.wordFrequencies['Douglas'] == 3
+    assert aggregates.wordFrequencies['DC-3'] == 2
+    assert aggregates.topTypes(1) == [TypeCrashes('Douglas DC-3', 2)]
+
+
+def writeRows(path, rows, mode='w', header=True):
+    with open(path, mode, newline='') as csvFile:
+        csvWriter = DictWriter(
+            csvFile, ['Type', 'Manufacturer'], lineterminator='\n')
+        if header:
+            csvWriter.writeheader()
+        csvWriter.writerows(rows)
+
+
+def sameAggregates(first, second):
+    return first.toState() == second.toState()
+
+
+def test_aggregate_reads_last_line_without_newline(tmp_path):
+    csvPath = str(tmp_path / 'crashes.csv')
+    writeRows(csvPath, ROWS[:1])
+    with open(csvPath, 'a') as csvFile:
+        csvFile.write('Boeing 747,')
+    assert aggregate(csvPath).crashesByType == \
+        {'Douglas DC-3': 1, 'Boeing 747': 1}
+
+
+def test_incremental_aggregate(tmp_path):
+    csvPath = str(tmp_path / 'crashes.csv')
+    statePath = str(tmp_path / 'state.json')
+    writeRows(csvPath, ROWS[:2])
+    assert sameAggregates(
+        aggregate(csvPath, statePath), CrashAggregates().addAll(ROWS[:2]))
+
+    writeRows(csvPath, ROWS[2:], 'a', header=False)
+    with open(csvPath, 'a') as csvFile:
+        # a row that is still being written is left for the next run
+        csvFile.write('Boeing 7')
+    assert sameAggregates(
+        aggregate(csvPath, statePath), CrashAggregates().addAll(ROWS))
+
+    with open(csvPath, 'a') as csvFile:
+        csvFile.write('47,\n')
+    assert aggregate(csvPath, statePath).crashesByType['Boeing 747'] == 1
+
+
+def test_incremental_aggregate_leaves_cut_off_quoted_row(tmp_path):
+    csvPath = str(tmp_path / 'crashes.csv')
+    statePath = str(tmp_path / 'state.json')
+    writeRows(csvPath, ROWS[:1])
+    with open(csvPath, 'a') as csvFile:
+        # the quoted field is cut off after its first complete line
+        csvFile.write('"Boeing\n')
+    aggregates = aggregate(csvPath, statePath)
+    assert sameAggregates(aggregates, CrashAggregates().addAll(ROWS[:1]))
+
+    with open(csvPath, 'a') as csvFile:
+        csvFile.write('747",Boeing\n')
+    aggregates = aggregate(csvPath, statePath)
+    assert aggregates.crashesByType['Boeing Boeing\n747'] == 1
+    assert sum(aggregates.crashesByType.values()) == 2
+
+
+def test_incremental_aggregate_malformed_row(tmp_path):
+    csvPath = str(tmp_path / 'crashes.csv')
+    writeRows(csvPath, ROWS[:1])
+    with open(csvPath, 'a') as csvFile:
+        csvFile.write('"Boeing"747,\n')
+        csvFile.write('Boeing 747,\n')
+    with raises(CsvError):
+        aggregate(csvPath, str(tmp_path / 'state.json'))
+
+
+def test_incremental_aggregate_rebuilds_rewritten_file(tmp_path):
+    csvPath = str(tmp_path / 'crashes.csv')
+    statePath = str(tmp_path / 'state.json')
+    writeRows(csvPath, ROWS)
+    aggregate(csvPath, statePath)
+
+    writeRows(csvPath, ROWS[:1])
+    assert sameAggregates(
+        aggregate(csvPath, statePath), CrashAggregates().addAll(ROWS[:1]))
+
+    writeRows(csvPath, ROWS[1:2])
+    assert sameAggregates(
+        aggregate(csvPath, statePath), CrashAggregates().addAll(ROWS[1:2]))
@@ -0,0 +1,422 @@
+from collections import Counter
+from io import StringIO
+
+from pytest import fixture, importorskip, raises
+
+import cleanCrashData
+from categories import SummaryTagger
+from cleanCrashData import CrashDataCleaner, init_worker, \
+    ModelNumberClassifier
+from compactdict import compile_dictionary, CompactDictionary
+from dictionary import Dictionary, SharedDictionary
+from instrumentation import Instrumentation
+from spellcheck import SpellChecker
+
+
+CSV_TEXT = '''Date,Time,Location,Operator,Flight #,Route,Type,Registration,cn/In,Aboard,Fatalities,Ground,Summary
+09/17/1908,17:18,"Fort Myer, Virginia",Military - U.S. Army,,Demonstration,Wright Flyer III,,1,2,1,0,"Crashed
+on a demonstration flight."
+07/12/1912,06:30,"AtlantiCity, New Jersey",Military - U.S. Navy,,Test flight,Dirigible,,,5,5,0,"Exploded."
+08/06/1913,,"Victoria, British Columbia, Canada",Private,-,,Curtiss seaplane,,,1,1,0,"The airplane fell."
+09/09/1913,18:30,Over the North Sea,Military - German Navy,,,Zeppelin L-1 (airship),,,20,14,0,Struck by lightning.
+10/17/1913,10:30,"Near Johannisthal, Germany",Military - German Navy,,,Zeppelin L-2 (airship),,,30,30,0,Hydrogen gas exploded.
+03/05/1915,01:00,"Tienen, Belgium",Military - German Navy,,,Zeppelin L-8 (airship),,,41,21,0,Shot down.
+09/03/1915,15:20,"Off Cuxhaven, Germany",Military - German Navy,,,Zeppelin L-10 (airship),,,19,19,0,Struck by lightning.
+'''
+
+COLLISION_CSV_TEXT = CSV_TEXT + '''01/05/1922,,"Near Thieuloy-St. Antoine, France",Daimler Airways / Grands Express Aeriens,,,de Havilland DH-18 / Farman F-60 Goliath,G-EAOW/FGEAD,4,7,7,0,Mid-air collision.
+02/02/1925,,"Paris, France",Private,,,Farman F-60 Goliath,,,3,3,0,Crashed.
+'''
+
+
+@fixture
+def input_file(tmp_path):
+    path = tmp_path / 'crashData.csv'
+    path.write_text(CSV_TEXT)
+    return str(path)
+
+
+class CountingDictionary(Dictionary):
+    """dictionary that keeps a Counter of the occurances added"""
+
+    def __init__(self, *args, **kwargs):
+        super(CountingDictionary, self).__init__(*args, **kwargs)
+        self.counted = Counter()
+
+    def add_occurance(self, word):
+        self.counted[word] += 1
+        super(CountingDictionary, self).add_occurance(word)
+
+
+def new_cleaner(dictionary_class=Dictionary, cleaner_class=CrashDataCleaner):
+    dictionary = dictionary_class(':memory:', delete_index=True)
+    for word in ['Wright', 'Flyer', 'Dirigible', 'Curtiss', 'Zeppelin']:
+        dictionary.add(word)
+    return cleaner_class(SpellChecker(dictionary))
+
+
+class FailingCleaner(CrashDataCleaner):
+    """cleaner that crashes after cleaning fail_after rows"""
+
+    fail_after = 5
+
+    def clean(self, row):
+        if self.fail_after == 0:
+            raise RuntimeError('crash')
+        self.fail_after -= 1
+        return super(FailingCleaner, self).clean(row)
+
+
+def test_run(input_file, tmp_path):
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    new_cleaner().run(input_file, output_file, offset=2)
+    with open(output_file) as csv_out:
+        lines = csv_out.read().splitlines()
+    assert len(lines) == 6
+    assert lines[0].startswith('Number,collisionWith,Date')
+    assert lines[1].startswith('2,,08/06/1913')
+
+
+def test_run_instrumentation(input_file, tmp_path):
+    progress = StringIO()
+    instrumentation = Instrumentation(progress_every=3, out_file=progress)
+    cleaner = new_cleaner()
+    cleaner.instrumentation = instrumentation
+    cleaner.spellchecker.instrumentation = instrumentation
+    cleaner.run(input_file, str(tmp_path / 'cleansedCrashData.csv'))
+
+    report = instrumentation.report()
+    assert report['counters']['rows'] == 7
+    assert report['counters']['spellchecks'] > 7
+    assert report['counters']['sql_statements'] > 0
+    assert {'clean', 'write'} <= set(report['timers'])
+    assert progress.getvalue().startswith('rows 3 (')
+    assert len(progress.getvalue().splitlines()) == 2
+
+
+def test_run_resumes_from_checkpoint(input_file, tmp_path):
+    expected_file = str(tmp_path / 'expected.csv')
+    new_cleaner().run(input_file, expected_file)
+
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    checkpoint_file = tmp_path / 'checkpoint.json'
+    cleaner = new_cleaner(cleaner_class=FailingCleaner)
+    with raises(RuntimeError):
+        cleaner.run(
+            input_file,
+            output_file,
+            checkpoint_path=str(checkpoint_file),
+            checkpoint_every=2)
+    assert checkpoint_file.exists()
+
+    resumed = new_cleaner()
+    resumed.run(
+        input_file,
+        output_file,
+        checkpoint_path=str(checkpoint_file),
+        checkpoint_every=2,
+        dedupe=True)
+    assert not checkpoint_file.exists()
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
+    # only the rows after the checkpoint were deduped
+    assert set(resumed.lookups['Type']) == {
+        'Zeppelin L-2 (airship)',
+        'Zeppelin L-8 (airship)',
+        'Zeppelin L-10 (airship)'}
+
+
+def test_run_restarts_for_changed_input(input_file, tmp_path):
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    checkpoint_file = str(tmp_path / 'checkpoint.json')
+    with raises(RuntimeError):
+        new_cleaner(cleaner_class=FailingCleaner).run(
+            input_file,
+            output_file,
+            checkpoint_path=checkpoint_file,
+            checkpoint_every=2)
+
+    # a row before the checkpoint's offset changes length
+    with open(input_file, 'w') as csv_in:
+        csv_in.write(CSV_TEXT.replace('"Exploded."', '"Blew up."'))
+    expected_file = str(tmp_path / 'expected.csv')
+    new_cleaner().run(input_file, expected_file)
+
+    new_cleaner().run(
+        input_file,
+        output_file,
+        checkpoint_path=checkpoint_file,
+        checkpoint_every=2)
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
+
+
+def test_run_classifies_types(input_file, tmp_path):
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    new_cleaner().run(input_file, output_file)
+    with open(output_file) as csv_out:
+        lines = csv_out.read().splitlines()
+    assert ',Zeppelin,L-10,,' in lines[-1]
+
+
+def test_model_number_classifier():
+    classifier = ModelNumberClassifier([
+        'Douglas',
+        'McDonnell Douglas',
+        'de Havilland',
+        'de Havilland Canada'])
+    assert classifier.classify('Douglas DC-3') == ('Douglas', 'DC-3', '')
+    assert classifier.classify('Douglas C-47A-DL') == \
+        ('Douglas', 'C-47', 'A-DL')
+    assert classifier.classify('McDonnell Douglas DC-9-32') == \
+        ('McDonnell Douglas', 'DC-9', '32')
+    assert classifier.classify('De Havilland DH-104 Dove') == \
+        ('de Havilland', 'DH-104 Dove', '')
+    assert classifier.classify('de Havilland Canada DHC-6 Twin Otter 200') \
+        == ('de Havilland Canada', 'DHC-6 Twin Otter', '200')
+    assert classifier.classify('Douglass DC-3') == ('', 'Douglass DC-3', '')
+    assert classifier.classify('Douglas') == ('Douglas', '', '')
+
+    classifier = ModelNumberClassifier(['Ford', 'Consolidated', 'Sikorsky'])
+    assert classifier.classify('Ford 4-AT-B') == ('Ford', '4-AT', 'B')
+    assert classifier.classify('Ford 4-AT-B Tri Motor') == \
+        ('Ford', '4-AT-B Tri Motor', '')
+    assert classifier.classify('Consolidated 32-2 Liberator I') == \
+        ('Consolidated', '32-2 Liberator', 'I')
+    assert classifier.classify('Sikorsky S-42B (flying boat)') == \
+        ('Sikorsky', 'S-42B (flying boat)', '')
+    assert classifier.classify('Sikorsky S-42 / Ford 5-AT') == \
+        ('Sikorsky', 'S-42 / Ford 5-AT', '')
+
+
+def test_run_classifies_slashed_type(tmp_path):
+    input_file = tmp_path / 'crashData.csv'
+    input_file.write_text(CSV_TEXT.replace(
+        'Curtiss seaplane', 'Junkers Ju-52/3m'))
+    output_file = tmp_path / 'cleansedCrashData.csv'
+    new_cleaner().run(str(input_file), str(output_file))
+    assert ',Junkers,Ju-52/3m,,' in output_file.read_text()
+
+
+def test_manufacturers_from_dictionary():
+    dictionary = Dictionary(':memory:')
+    dictionary.add_manufacturer('Zeppelin')
+    dictionary.add_manufacturer('Zeppelin')
+    assert dictionary.all_manufacturers() == ['Zeppelin']
+    classifier = ModelNumberClassifier.from_dictionary(dictionary)
+    assert classifier.classify('Zeppelin L-1') == ('Zeppelin', 'L-1', '')
+
+
+def test_split_collision_rows():
+    row = {
+        'Number': 3,
+        'Operator': 'Daimler Airways / Grands Express Aeriens',
+        'Type': 'de Havilland DH-18 / Farman F-60 Goliath',
+        'Registration': 'G-EAOW',
+        'Aboard': '7',
+        'Fatalities': '7',
+        'Ground': '0',
+        'Summary': 'Mid-air collision.',
+    }
+    original = dict(row)
+    cleaner = new_cleaner()
+    cleaner.row_counter = 4
+    first, second = cleaner.split_collision_rows([row])
+    assert row == original
+    assert first['Number'] == 3 and second['Number'] == 4
+    assert first['collisionWith'] == 4 and second['collisionWith'] == 3
+    assert first['Type'] == 'de Havilland DH-18'
+    assert second['Type'] == 'Farman F-60 Goliath'
+    assert first['Operator'] == 'Daimler Airways'
+    assert second['Operator'] == 'Grands Express Aeriens'
+    assert first['Registration'] == second['Registration'] == 'G-EAOW'
+    assert first['category'] == second['category'] == 'collision'
+    # the totals are for both aircraft, counted once
+    assert (first['Aboard'], first['Fatalities'], first['Ground']) == \
+        ('7', '7', '0')
+    assert second['Aboard'] == second['Fatalities'] == second['Ground'] == ''
+
+    row['Summary'] = 'Crashed in fog.'
+    assert list(cleaner.split_collision_rows([row])) == \
+        [dict(row, category='weather')]
+
+
+def test_split_collided_rows():
+    # collisions before categories were only found by 'collision' and
+    # 'mid-air'
+    cleaner = new_cleaner()
+    for summary in ('The two aircraft collided.', 'A midair over the city.'):
+        row = {
+            'Number': 1,
+            'Type': 'Douglas DC-3 / Douglas DC-4',
+            'Summary': summary,
+        }
+        first, second = cleaner.split_collision_rows([row])
+        assert first['Type'] == 'Douglas DC-3'
+        assert second['Type'] == 'Douglas DC-4'
+
+    row['Summary'] = 'Struck trees and caught fire.'
+    assert len(list(cleaner.split_collision_rows([row]))) == 1
+
+
+def test_summary_tagger():
+    tagger = SummaryTagger()
+    assert tagger.tags('Crashed.') == []
+    assert tagger.tags(
+        'Mid-air collision in a THUNDERSTORM. Both aircraft caught fire.') \
+        == ['collision', 'fire', 'weather']
+    assert tagger.tags('The aircraft ran out of fuel.') == ['fuel exhaustion']
+    assert tagger.category('Shot down by a missile.') == 'shot down'
+    # keywords match whole words only
+    assert tagger.tags(
+        'Crashed near Mount Rainier in Iceland after the pilot was fired.') \
+        == []
+    assert tagger.tags('Flew into thunderstorms over the mountains.') == \
+        ['weather', 'terrain']
+    assert SummaryTagger({'a': ('x',), 'b': ('y', 'yz')}).category(
+        'yz x') == 'a;b'
+
+
+def test_dedupe(input_file, tmp_path):
+    expected_file = str(tmp_path / 'expected.csv')
+    new_cleaner().run(input_file, expected_file)
+
+    cleaner = new_cleaner()
+    report = StringIO()
+    assert cleaner.dedupe(input_file, report) == {'Type': (7, 7)}
+    assert report.getvalue() == \
+        'Type: 7 values, 7 distinct, 0 cleanings saved (0.0%)\n'
+    assert cleaner.lookups['Type']['Curtiss seaplane'] == \
+        ('Curtiss seaplane', ['Curtiss'], {'seaplane': 1})
+
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    cleaner.run(input_file, output_file)
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
+
+    cleaner = new_cleaner()
+    assert cleaner.dedupe(input_file, StringIO(), offset=5) == {
+        'Type': (2, 2)}
+
+
+def test_dedupe_counts_every_row(tmp_path):
+    input_file = tmp_path / 'crashData.csv'
+    header, rows = CSV_TEXT.split('\n', 1)
+    input_file.write_text(header + '\n' + rows * 4)
+    counts = []
+    for dedupe in (False, True):
+        cleaner = new_cleaner(CountingDictionary)
+        cleaner.run(
+            str(input_file),
+            str(tmp_path / 'cleansedCrashData.csv'),
+            dedupe=dedupe)
+        counts.append((
+            cleaner.spellchecker.words_not_found,
+            cleaner.spellchecker.dictionary.counted))
+    assert counts[0] == counts[1]
+    assert counts[1][0]['seaplane'] == 4
+    assert counts[1][1]['Curtiss'] == 4
+
+
+def test_columnar_run_matches_run(input_file, tmp_path):
+    columnar = importorskip('columnar')
+    expected_file = str(tmp_path / 'expected.csv')
+    new_cleaner().run(input_file, expected_file, offset=1)
+
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    cleaner = columnar.ColumnarCrashDataCleaner(new_cleaner())
+    cleaner.run(input_file, output_file, offset=1)
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
+
+
+def test_columnar_split_matches_run(tmp_path):
+    columnar = importorskip('columnar')
+    input_file = tmp_path / 'crashData.csv'
+    input_file.write_text(COLLISION_CSV_TEXT)
+    expected_file = str(tmp_path / 'expected.csv')
+    new_cleaner().run(str(input_file), expected_file, offset=3)
+    with open(expected_file) as expected:
+        lines = expected.read().splitlines()
+    assert len(lines) == 8
+    assert lines[-3].startswith('7,8,01/05/1922')
+    assert lines[-2].startswith('8,7,01/05/1922')
+    assert ',collision,7,7,0,' in lines[-3]
+    assert ',collision,,,,' in lines[-2]
+
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    cleaner = columnar.ColumnarCrashDataCleaner(new_cleaner())
+    cleaner.run(str(input_file), output_file, offset=3)
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
+
+
+def test_parallel_run_matches_run(tmp_path):
+    input_file = tmp_path / 'crashData.csv'
+    input_file.write_text(CSV_TEXT + ''.join(
+        '01/01/1920,,Nowhere,Private,,,Qqqq,,,1,1,0,Crashed.\n'
+        for _ in range(10)))
+    expected_file = str(tmp_path / 'expected.csv')
+    serial = new_cleaner()
+    serial.run(str(input_file), expected_file)
+    assert serial.spellchecker.words_not_found['Qqqq'] == 10
+
+    db_file = str(tmp_path / 'words.sqlite')
+    dictionary = Dictionary(db_file, delete_index=True)
+    for word in ['Wright', 'Flyer', 'Dirigible', 'Curtiss', 'Zeppelin']:
+        dictionary.add(word)
+    cleaner = CrashDataCleaner(SpellChecker(dictionary))
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    cleaner.run(str(input_file), output_file, jobs=2, chunk_size=2)
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
+    assert cleaner.spellchecker.words_not_found == \
+        serial.spellchecker.words_not_found
+
+
+def test_parallel_run_with_compact_dictionary(input_file, tmp_path):
+    expected_file = str(tmp_path / 'expected.csv')
+    new_cleaner().run(input_file, expected_file)
+
+    db_file = str(tmp_path / 'words.sqlite')
+    dictionary = Dictionary(db_file)
+    for word in ['Wright', 'Flyer', 'Dirigible', 'Curtiss', 'Zeppelin']:
+        dictionary.add(word)
+    cleaner = CrashDataCleaner(SpellChecker(dictionary))
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    cleaner.run(
+        input_file,
+        output_file,
+        jobs=2,
+        chunk_size=2,
+        compact_path=str(tmp_path / 'words.cdict'))
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
+
+
+def test_compact_worker_has_no_trie(tmp_path):
+    db_file = str(tmp_path / 'words.sqlite')
+    with Dictionary(db_file) as dictionary:
+        dictionary.add('Zeppelin')
+        compact_path = str(tmp_path / 'words.cdict')
+        compile_dictionary(dictionary, compact_path)
+    init_worker(db_file, True, False, 0.5, 2, {}, compact_path)
+    dictionary = cleanCrashData.worker_cleaner.spellchecker.dictionary
+    assert isinstance(dictionary, CompactDictionary)
+    assert dictionary.trie is None
+    dictionary.close()
+
+
+def test_parallel_run_with_shared_dictionary(input_file, tmp_path):
+    expected_file = str(tmp_path / 'expected.csv')
+    new_cleaner().run(input_file, expected_file)
+
+    db_file = str(tmp_path / 'words.sqlite')
+    dictionary = SharedDictionary(db_file, delete_index=True)
+    for word in ['Wright', 'Flyer', 'Dirigible', 'Curtiss', 'Zeppelin']:
+        dictionary.add(word)
+    cleaner = CrashDataCleaner(SpellChecker(dictionary))
+    output_file = str(tmp_path / 'cleansedCrashData.csv')
+    cleaner.run(input_file, output_file, jobs=2, chunk_size=2)
+    with open(expected_file) as expected, open(output_file) as actual:
+        assert expected.read() == actual.read()
@@ -1,11 +1,18 @@
 
-from pytest import fixture, raises
+from threading import Thread
 
-from dictionary import Dictionary, WordRecord
-from spellcheck import delete_generator, inserts_generator, \
-    replace_generator, SpellChecker, split_generator, transpose_generator, \
-    validate_alphabet, validate_word
-from tokenizer import Tokenizer
+from pytest import fixture, mark, raises
+
+from compactdict import compile_dictionary, CompactDictionary
+from dictionary import CachedDictionary, Dictionary, DictionaryError, \
+    SharedDictionary, WordRecord
+from spellcheck import delete_generator, edit_distance, inserts_generator, \
+    replace_generator, SpellChecker, sorted_alphabet, split_generator, \
+    transpose_generator, validate_alphabet, validate_word
+from subsequence_group import RingWindow, subsequence_group, \
+    subsequence_views
+from tokenizer import FastTokenizer, Tokenizer
+from trie import Trie
 
 
 def test_validate_word():
@@ -112,6 +119,21 @@ def test_inserts_generator():
     }
     actual = inserts_generator('X', set('ab'))
     assert expected == set(actual)
+
+
+def test_batched_generators():
+    alphabet = set('ba')
+    assert list(replace_generator('at', alphabet, batched=True)) == \
+        [['bt'], ['aa', 'ab']]
+    assert list(inserts_generator('X', alphabet, batched=True)) == \
+        [['aX', 'bX'], ['Xa', 'Xb']]
+    assert list(delete_generator('mat', batched=True)) == \
+        [['at', 'mt', 'ma']]
+    assert list(transpose_generator('mat', batched=True)) == \
+        [['amt', 'mta']]
+    # tuples are taken to be sorted already
+    assert list(inserts_generator('X', ('b', 'a'))) == \
+        ['bX', 'aX', 'Xb', 'Xa']
         
 
 class TestDictionary(object):
@@ -132,12 +154,287 @@ class TestDictionary(object):
         assert dictionary['bravo'] == WordRecord('bravo', 1)
         assert dictionary['charlie'] == WordRecord('charlie', 1)
 
+    def test_lookup_many(self):
+        dictionary = Dictionary(':memory:')
+        dictionary.MAX_SQL_PARAMETERS = 2
+        for word in ['alpha', 'alpha', 'bravo', 'charlie']:
+            dictionary.add(word)
+
+        found = dictionary.lookup_many(['alpha', 'bravo', 'delta', 'alpha'])
+        assert found == {'alpha': 2, 'bravo': 1}
+        assert dictionary.lookup_many([]) == {}
+
+    def test_train(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        dictionary = Dictionary(db_file, delete_index=True)
+        dictionary.add('crashed')
+        texts = ['Crashed on take-off.', 'The plane crashed, 2 killed.']
+        assert dictionary.train(texts, chunk_size=3) == 8
+        assert dictionary.words_scanned == 8
+        assert dictionary['crashed'] == WordRecord('crashed', 2)
+        assert dictionary['Crashed'] == WordRecord('Crashed', 1)
+        assert dictionary.similar_words('plnae') == {'plane'}
+        assert dictionary.lookup_bigrams(
+            [('The', 'plane'), ('plane', 'crashed'), ('crashed', 'killed')]) \
+            == {('The', 'plane'): 1, ('plane', 'crashed'): 1}
+
+        dictionary = Dictionary(db_file)
+        assert dictionary.words_scanned == 8
+        assert dictionary['killed'] == WordRecord('killed', 1)
+
+    def test_deletes_kept_without_index(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        Dictionary(db_file, delete_index=True).add('crashed')
+        # a deletes table that exists is kept up to date when training
+        # without the index
+        dictionary = Dictionary(db_file)
+        dictionary.train(['The plane crashed.'])
+        dictionary.add('killed')
+        dictionary = Dictionary(db_file, delete_index=True)
+        assert dictionary.similar_words('plnae') == {'plane'}
+        assert dictionary.similar_words('klled') == {'killed'}
+
+        # words missing from the index are added when it is opened
+        dictionary.cursor.execute("DELETE FROM deletes WHERE word = 'plane'")
+        dictionary.conn.commit()
+        dictionary = Dictionary(db_file, delete_index=True)
+        assert dictionary.similar_words('plnae') == {'plane'}
+
+
+def test_trie():
+    trie = Trie(['douglas', 'dornier', 'do', 'boeing'])
+    assert len(trie) == 4
+    assert not trie.add('do')
+    assert 'do' in trie
+    assert 'dou' not in trie
+    assert trie.has_prefix('dou')
+    assert not trie.has_prefix('dx')
+
+    assert trie.search('douglas', 0) == [('douglas', 0)]
+    assert set(trie.search('dougals', 1)) == {('douglas', 1)}
+    assert set(trie.search('duglass', 2)) == {('douglas', 2)}
+    assert set(trie.search('dornir', 3)) == {('dornier', 1)}
+    assert set(trie.search('dorni', 3)) == {('dornier', 2), ('do', 3)}
+    assert set(trie.search('d', 1)) == {('do', 1)}
+    assert trie.search('zzz', 2) == []
+
+
+def test_trie_longest_prefix():
+    trie = Trie(['de havilland', 'de havilland canada', 'do'])
+    assert trie.longest_prefix('de havilland canada dhc-6') == \
+        'de havilland canada'
+    assert trie.longest_prefix('de havilland dh-4') == 'de havilland'
+    assert trie.longest_prefix('de havilland') == 'de havilland'
+    assert trie.longest_prefix('dornier 228') is None
+    assert trie.longest_prefix('do 228') == 'do'
+
+
+def test_words_within():
+    dictionary = Dictionary(':memory:')
+    dictionary.add('douglas')
+    assert dictionary.words_within('dgulas', 2) == [('douglas', 2)]
+    dictionary.add('lockheed')
+    assert dictionary.words_within('lokhed', 2) == [('lockheed', 2)]
+
+
+class TestCachedDictionary(object):
+
+    def test_reads_from_index(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        with Dictionary(db_file) as dictionary:
+            dictionary.add('alpha', 3)
+            dictionary.add_skip('zulu')
+
+        dictionary = CachedDictionary(db_file)
+        assert 'alpha' in dictionary
+        assert 'Alpha' not in dictionary
+        assert dictionary['alpha'] == WordRecord('alpha', 3)
+        assert dictionary.in_skips('zulu')
+        with raises(KeyError):
+            dictionary['bravo']
+        assert dictionary.lookup_many(['alpha', 'bravo']) == {'alpha': 3}
+
+    def test_similar_words(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        with Dictionary(db_file) as dictionary:
+            dictionary.add('alpha')
+
+        # building the index for an existing dictionary
+        with CachedDictionary(db_file, delete_index=True) as dictionary:
+            dictionary.add('bravo')
+            assert dictionary.similar_words('bravx') == {'bravo'}
+            assert dictionary.similar_words('lpha') == {'alpha'}
+
+        dictionary = Dictionary(db_file, delete_index=True)
+        assert dictionary.similar_words('bravo') == {'bravo'}
+        assert dictionary.similar_words('alpah') == {'alpha'}
+        assert dictionary.similar_words('lpa') == set()
+        assert dictionary.similar_words('lpa', 2) == {'alpha'}
+
+    def test_write_back(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        with CachedDictionary(db_file, flush_threshold=3) as dictionary:
+            dictionary.add('alpha')
+            dictionary.add('alpha')
+            assert dictionary['alpha'] == WordRecord('alpha', 2)
+            assert 'alpha' not in Dictionary(db_file)
+
+            dictionary.add('bravo')
+            assert Dictionary(db_file)['alpha'] == WordRecord('alpha', 2)
+
+            dictionary.add_occurance('bravo')
+            assert Dictionary(db_file)['bravo'] == WordRecord('bravo', 1)
+
+        assert Dictionary(db_file)['bravo'] == WordRecord('bravo', 2)
+
+    def test_add_counts(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        with CachedDictionary(db_file, delete_index=True) as dictionary:
+            dictionary.add('alpha')
+            new_words = dictionary.add_counts({'alpha': 2, 'bravo': 3})
+            assert new_words == ['bravo']
+            assert dictionary['alpha'] == WordRecord('alpha', 3)
+            assert dictionary.similar_words('brav') == {'bravo'}
+            assert dictionary.words_scanned == 5
+
+        dictionary = Dictionary(db_file)
+        assert dictionary.lookup_many(['alpha', 'bravo']) == \
+            {'alpha': 3, 'bravo': 3}
+        assert dictionary.words_scanned == 5
+
+
+class RacingDictionary(SharedDictionary):
+    """shared dictionary that looks for a word before another writer adds
+    it"""
+
+    def __contains__(self, word):
+        return False
+
+
+class TestSharedDictionary(object):
+
+    def test_wal(self, tmp_path):
+        dictionary = SharedDictionary(str(tmp_path / 'words.sqlite'))
+        dictionary.cursor.execute("PRAGMA journal_mode")
+        assert dictionary.cursor.fetchone() == ('wal',)
+        with raises(DictionaryError):
+            SharedDictionary(':memory:')
+
+    def test_concurrent_increments(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        with SharedDictionary(db_file) as dictionary:
+            dictionary.add('alpha')
+        # two dictionaries on the file, as if in two processes, each used
+        # by several threads with their own connections
+        dictionaries = [
+            SharedDictionary(db_file, flush_threshold=7) for _ in range(2)]
+
+        def count(dictionary):
+            for _ in range(100):
+                dictionary.add_occurance('alpha')
+            dictionary.flush()
+
+        threads = [
+            Thread(target=count, args=(dictionary,))
+            for dictionary in dictionaries * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for dictionary in dictionaries:
+            # the creating thread's and one per counting thread
+            assert len(dictionary.connections) == 4
+            dictionary.close()
+
+        assert Dictionary(db_file)['alpha'] == WordRecord('alpha', 601)
+
+    def test_add_after_another_writer(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        with SharedDictionary(db_file) as dictionary:
+            dictionary.add('alpha')
+            dictionary.add_skip('kilo')
+        with RacingDictionary(db_file) as dictionary:
+            assert not dictionary.add('alpha')
+            dictionary.add_skip('kilo')
+        assert Dictionary(db_file)['alpha'] == WordRecord('alpha', 2)
+
+
+class TestCompactDictionary(object):
+
+    @fixture
+    def compact(self, tmp_path):
+        db_file = str(tmp_path / 'words.sqlite')
+        with Dictionary(db_file) as dictionary:
+            for word, occurances in [
+                    ('bravo', 2), ('alpha', 3), ('été', 1), ('zulu', 4)]:
+                dictionary.add(word, occurances)
+            dictionary.add_skip('kilo')
+            dictionary.add_skip('echo')
+            dictionary.add_counts(
+                {}, 0, {('alpha', 'bravo'): 2, ('bravo', 'zulu'): 1})
+            dictionary.words_scanned = 10
+            compact_path = str(tmp_path / 'words.cdict')
+            compile_dictionary(dictionary, compact_path)
+        with CompactDictionary(compact_path) as compact:
+            yield compact
+
+    def test_lookups(self, compact):
+        assert len(compact) == 4
+        assert 'alpha' in compact
+        assert 'été' in compact
+        assert 'Alpha' not in compact
+        assert 'alph' not in compact
+        assert compact['zulu'] == WordRecord('zulu', 4)
+        with raises(KeyError):
+            compact['charlie']
+        assert compact.lookup_many(['bravo', 'charlie', 'été']) == \
+            {'bravo': 2, 'été': 1}
+        assert compact.probability('alpha') == 0.3
+        assert compact.all_words() == ['alpha', 'bravo', 'zulu', 'été']
+
+    def test_bigrams(self, compact):
+        assert compact.lookup_bigrams(
+            [('alpha', 'bravo'), ('bravo', 'alpha'), ('bravo', 'zulu')]) == \
+            {('alpha', 'bravo'): 2, ('bravo', 'zulu'): 1}
+        assert sorted(compact.bigram_items()) == \
+            [('alpha', 'bravo', 2), ('bravo', 'zulu', 1)]
+
+    def test_skips(self, compact):
+        assert compact.in_skips('kilo')
+        assert compact.in_skips('echo')
+        assert not compact.in_skips('alpha')
+
+    def test_read_only(self, compact):
+        compact.add_occurance('alpha')
+        assert compact['alpha'] == WordRecord('alpha', 3)
+        with raises(DictionaryError):
+            compact.add('charlie')
+
+    def test_prefixes(self, compact):
+        prefixes = compact.prefixes()
+        assert 'al' in prefixes
+        assert 'été' in prefixes
+        assert 'zulu' in prefixes
+        assert 'zulus' not in prefixes
+        assert 'c' not in prefixes
+        assert compact.characters() == set('alphabrvoétzu')
+
+    def test_spellchecker_without_trie(self, compact):
+        spellchecker = SpellChecker(compact)
+        assert spellchecker.check('alpah') == 'alpha'
+        assert compact.trie is None
+
+    def test_words_within(self, compact):
+        assert sorted(compact.words_within('alpah', 1)) == [('alpha', 1)]
+
  
  
-@fixture
-def dictionary():
+@fixture(params=['generators', 'delete_index', 'trie'])
+def dictionary(request):
     
-    dictionary = Dictionary(':memory:')
+    dictionary = Dictionary(
+        ':memory:',
+        delete_index=request.param == 'delete_index')
     
     words = [
         ('to', 5),
@@ -149,6 +446,8 @@ def dictionary():
     
     for word, occurances in words:
         dictionary.add(word, occurances)
+    if request.param == 'trie':
+        dictionary.build_trie()
         
     dictionary.words_scanned = sum([c for w, c in words])      
     return dictionary
@@ -157,6 +456,56 @@ def dictionary():
 @fixture
 def spell_checker(dictionary):
     return SpellChecker(dictionary)    
+
+
+def test_pruned_edits(dictionary):
+    spellchecker = SpellChecker(dictionary)
+    prefixes = spellchecker.prefixes()
+    alphabet = sorted_alphabet(spellchecker.alphabet)
+
+    def edits(word, edit, extend=True):
+        return set(spellchecker.pruned_edits(
+            word, edit, prefixes, alphabet, extend))
+
+    assert prefixes == {'t', 'to', 'b', 'be', 'i', 'is', 'h', 'he', 'w', 'we'}
+    assert edits('ot', 'transpose') == {'to'}
+    assert edits('bex', 'delete') == {'be'}
+    # only the last character of the result is left to the lookup
+    assert edits('tx', 'replace') == {'to', 'bx', 'ix', 'hx', 'wx'}
+    # nothing starts with 'x', so only the first character is edited
+    assert edits('xyz', 'replace') == {'tyz', 'byz', 'iyz', 'hyz', 'wyz'}
+    assert edits('xyz', 'insert') == {'txyz', 'bxyz', 'ixyz', 'hxyz', 'wxyz'}
+    # without extend the positions are still limited, but not the edits
+    assert edits('bxxe', 'delete', extend=False) == {'xxe', 'bxe'}
+
+    # the set is kept up to date rather than built again
+    dictionary.add('At')
+    assert spellchecker.prefixes() is prefixes
+    assert {'A', 'At'} <= prefixes
+
+    # the alphabet is widened with the dictionary's characters once
+    assert 'A' not in spellchecker.alphabet
+    assert 'A' in SpellChecker(dictionary).alphabet
+
+
+def test_cached_prefixes():
+    dictionary = CachedDictionary(':memory:')
+    dictionary.add('to')
+    prefixes = dictionary.prefixes()
+    dictionary.add('tea')
+    dictionary.add_counts({'ox': 1})
+    assert dictionary.prefixes() is prefixes
+    assert prefixes == {'t', 'to', 'te', 'tea', 'o', 'ox'}
+
+
+def test_edit_distance():
+    assert edit_distance('alpha', 'alpha') == 0
+    assert edit_distance('alpha', 'alphas') == 1
+    assert edit_distance('alpha', 'lpha') == 1
+    assert edit_distance('alpha', 'alpah') == 1
+    assert edit_distance('alpha', 'alpho') == 1
+    assert edit_distance('it', 'to') == 2
+    assert edit_distance('', 'to') == 2
  
  
 class TestSpellChecker(object):
@@ -198,13 +547,170 @@ class TestSpellChecker(object):
         }
         assert expected == set(candidates)
         
-    def test_check_text(self, spell_checker):
-        spellchecker = SpellChecker(Dictionary(':memory:'), interactive=True)
+    def test_find_candidates_distance2(self, spell_checker):
+        candidates = spell_checker.find_candidates('ixx', max_distance=2)
+        assert {(0.2667, 'is', None)} == {
+            (round(p, 4), c1, c2) for p, c1, c2 in candidates}
+        # the first delete leaves 'bxe', which no dictionary word starts with
+        candidates = spell_checker.find_candidates('bxxe', max_distance=2)
+        assert {(0.1333, 'be', None)} == {
+            (round(p, 4), c1, c2) for p, c1, c2 in candidates}
+
+    def test_find_candidates_stops_early(self, spell_checker):
+        candidates = spell_checker.find_candidates('e')
+        assert len(list(candidates)) == 3
+        candidates = spell_checker.find_candidates('e', 1)
+        assert len(list(candidates)) == 1
+        candidates = spell_checker.find_candidates('e', 1, threshold=0.15)
+        assert [c for _, c, _ in candidates][-1] in ('be', 'we')
+
+    def test_automatic_replace(self, spell_checker):
+        assert 'we' == spell_checker.check('wet')
+        assert 'to be' == spell_checker.check('tobe')
+        # falls back to distance 2
+        assert 'is' == spell_checker.check('ixx')
+        # 'we' holds half of the probability of be, he and we
+        assert 'we' == spell_checker.check('e')
+        assert not spell_checker.words_not_found
+
+        spell_checker.confidence_threshold = 0.6
+        spell_checker.clear_memo()
+        assert 'e' == spell_checker.check('e')
+        assert 'qqqq' == spell_checker.check('qqqq')
+        assert spell_checker.words_not_found == {'e': 1, 'qqqq': 1}
+
+    def test_check_needs_a_clear_winner(self, dictionary, spell_checker):
+        dictionary.add('ho', 5)
+        spell_checker.clear_memo()
+        # 'to' and 'ho' are equally common and equally close
+        assert 'tho' == spell_checker.check('tho')
+        assert spell_checker.words_not_found['tho'] == 1
+
+    def test_check_memo_words_not_found(self, dictionary, spell_checker):
+        assert 'qqqq' == spell_checker.check('qqqq')
+        assert 'qqqq' == spell_checker.check('qqqq')
+        assert spell_checker.words_not_found['qqqq'] == 2
+        dictionary.add_skip('qqqq')
+        assert 'qqqq' == spell_checker.check('qqqq')
+        assert 'qqqq' == spell_checker.check('qqqq')
+        assert spell_checker.words_not_found['qqqq'] == 2
+
+    def test_check_untrained_dictionary(self, dictionary, spell_checker):
+        dictionary.words_scanned = 0
+        assert 'wex' == spell_checker.check('wex')
+        assert spell_checker.words_not_found['wex'] == 1
+
+    def test_check_memo(self, spell_checker):
+        dictionary = spell_checker.dictionary
+        assert 'we' == spell_checker.check('we')
+        assert 'we' == spell_checker.check('we')
+        assert dictionary['we'] == WordRecord('we', 5)
+        assert 'he' == spell_checker.check('hx')
+        assert 'he' == spell_checker.check('hx')
+        assert 'qqqq' == spell_checker.check('qqqq')
+        assert 'qqqq' == spell_checker.check('qqqq')
+        assert spell_checker.words_not_found == {'qqqq': 2}
+        assert (spell_checker.memo_hits, spell_checker.memo_misses) == (3, 3)
+
+        # adding a word invalidates the memo
+        dictionary.add('hx')
+        assert 'hx' == spell_checker.check('hx')
+        assert spell_checker.memo_misses == 4
+        assert list(spell_checker.memo) == [('hx', None, None)]
+
+        spell_checker.memo_size = 1
+        spell_checker.check('we')
+        assert list(spell_checker.memo) == [('we', None, None)]
+
+    def test_check_text(self, dictionary, spell_checker):
+        for word in ['Havilland', 'Farman', 'Goliath']:
+            dictionary.add(word)
+        dictionary.add_skip('F')
         text_in = ' Havilland F-60 FarmanGoliath'
-        text_out = "".join(spellchecker.check_text(text_in, Tokenizer()))    
-        assert 'Havilland F-60 Farman Goliath' == text_out
+        text_out = "".join(spell_checker.check_text(text_in, Tokenizer()))
+        assert ' Havilland F-60 Farman Goliath' == text_out
+
+
+def test_check_text_keeps_token_order():
+    dictionary = Dictionary(':memory:')
+    dictionary.train(['Fokker F.VII, Douglas DC-3 Junkers'])
+    spellchecker = SpellChecker(dictionary)
+    text_out = ''.join(spellchecker.check_text(
+        ' Fokker F.VII, Dougls DC-3 (Junkerss)', FastTokenizer(True)))
+    assert text_out == ' Fokker F.VII, Douglas DC-3 (Junkers)'
+
+    dictionary.add('Goliath')
+    text_out = ''.join(spellchecker.check_text(
+        'Farman Go liath', FastTokenizer(True)))
+    assert text_out == 'Farman Goliath'
+    assert ''.join(spellchecker.check_text('', FastTokenizer(True))) == ''
+
+
+def test_context():
+    dictionary = Dictionary(':memory:')
+    dictionary.train(
+        ['Douglas DC', 'Douglas DC', 'Lockheed Electra', 'Lockheed Electra'] +
+        ['Douglass', 'Electro'] * 5)
+    spellchecker = SpellChecker(dictionary)
+    assert spellchecker.check('Douglasx') == 'Douglass'
+    assert spellchecker.check('Douglasx', 'DC') == 'Douglas'
+    assert spellchecker.check('Electrx') == 'Electro'
+    assert spellchecker.check('Electrx', previous_word='Lockheed') == \
+        'Electra'
+
+    words_out = [
+        token
+        for token in spellchecker.check_text(
+            'Lockheed Electrx Douglasx DC', FastTokenizer())
+        if not token.isspace()]
+    assert words_out == ['Lockheed', 'Electra', 'Douglas', 'DC']
+
+    spellchecker = SpellChecker(dictionary, context_weight=0)
+    assert spellchecker.check('Douglasx', 'DC') == 'Douglass'
+    # a little context doesn't outweigh Douglass being more common
+    spellchecker = SpellChecker(dictionary, context_weight=0.1)
+    assert spellchecker.check('Douglasx', 'DC') == 'Douglass'
+    assert spellchecker.check('Douglasx', 'DC', 'Lockheed') == 'Douglass'
+    spellchecker = SpellChecker(dictionary, context_weight=0.9)
+    assert spellchecker.check('Douglasx', 'DC') == 'Douglas'
 
                 
+def test_subsequence_group():
+    assert list(subsequence_group('abcd', 2)) == \
+        [('a', 'b'), ('b', 'c'), ('c', 'd')]
+    assert list(subsequence_group('a', 3)) == [('a', None, None)]
+    assert list(subsequence_group('', 2)) == [(None, None)]
+    assert list(subsequence_group('abc', 2, pad=True, fill='-')) == \
+        [('a', 'b'), ('b', 'c'), ('c', '-')]
+    assert list(subsequence_group('a', 3, pad=True)) == [('a', None, None)]
+    assert list(subsequence_group('', 2, pad=True)) == []
+
+
+@mark.parametrize('items,group_length,pad', [
+    ('abcde', 3, False),
+    ('abcde', 3, True),
+    ('ab', 3, False),
+    ('ab', 3, True),
+    ('', 2, False),
+    ('', 2, True),
+])
+def test_subsequence_views(items, group_length, pad):
+    views = [
+        tuple(view)
+        for view in subsequence_views(items, group_length, pad)]
+    assert views == list(subsequence_group(items, group_length, pad))
+
+
+def test_ring_window():
+    window = RingWindow(3)
+    for item in 'abcd':
+        window.push(item)
+    assert (len(window), window[0], window[-1]) == (3, 'b', 'd')
+    assert list(window) == ['b', 'c', 'd']
+    with raises(IndexError):
+        window[3]
+
+
 def test_tokenize():
     tokenizer = Tokenizer()
     text_in = "hello world!"
@@ -214,7 +720,23 @@ def test_tokenize():
     text_in = 'De Havilland DH-4'
     tokens_out = list(tokenizer.tokenize(text_in))
     assert tokens_out == ['De', ' ', 'Havilland', ' ', 'DH', '-', '4']
-    
 
 
+@mark.parametrize('hyphen_continues_word', [False, True])
+def test_fast_tokenizer(hyphen_continues_word):
+    tokenizer = Tokenizer(hyphen_continues_word)
+    fast_tokenizer = FastTokenizer(hyphen_continues_word)
+    texts = [
+        '',
+        'hello world!',
+        'De Havilland DH-4',
+        ' Havilland F-60 FarmanGoliath ',
+        'Lioré-et-Olivier LeO 213\t(airship)',
+        '--a_b__c--d__-',
+        'ab\x00cd\x07 e\xa0f\u200bg',
+        '\x00\x07',
+    ]
+    for text in texts:
+        expected = list(tokenizer.tokenize(text))
+        assert expected == list(fast_tokenizer.tokenize(text))
 
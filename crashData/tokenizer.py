@@ -1,3 +1,4 @@
+from re import compile as re_compile
 
 
 class Tokenizer(object):
@@ -98,3 +99,47 @@ class Tokenizer(object):
             
         yield "".join(self.char_buffer)
             
+
+
+class FastTokenizer(Tokenizer):
+    """Produces the same tokens as Tokenizer, but finds each run of
+    alphanumeric, whitespace or other printable characters with one
+    precompiled regex and yields it as a slice of the input"""
+
+    # [^\W_] matches exactly the characters for which str.isalnum() is true
+    # and \s the characters for which str.isspace() is true.  Runs that mix
+    # two character classes (e.g. alphanumerics and hyphens) are unrolled,
+    # which is much faster than repeating an alternation.
+    RUNS = re_compile(
+        r'[^\W_]+'
+        r'|\s+'
+        r'|[^\w\s]+(?:_+[^\w\s]*)*|_+(?:[^\w\s]+_*)*')
+    HYPHEN_RUNS = re_compile(
+        r'[^\W_]+(?:-+[^\W_]*)*|-+(?:[^\W_]+-*)*'
+        r'|\s+'
+        r'|[^\w\s-]+(?:_+[^\w\s-]*)*|_+(?:[^\w\s-]+_*)*')
+
+    def __init__(
+            self,
+            hyphen_continues_word=False):
+        super(FastTokenizer, self).__init__(hyphen_continues_word)
+        if hyphen_continues_word:
+            self.runs = self.HYPHEN_RUNS
+        else:
+            self.runs = self.RUNS
+
+    @staticmethod
+    def drop_unprintable(text_in):
+        """Tokenizer ignores characters that are neither printable nor
+        whitespace, they don't end the current token"""
+        return ''.join(c for c in text_in if c.isprintable() or c.isspace())
+
+    def tokenize(self, text_in):
+        if not text_in.isprintable():
+            text_in = self.drop_unprintable(text_in)
+
+        tokens = self.runs.findall(text_in)
+        if not tokens:
+            # Tokenizer always yields its final, possibly empty, buffer
+            tokens = ['']
+        yield from tokens
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentParser
+from csv import DictReader
+from sys import stderr
+
+from dictionary import Dictionary
+
+
+def field_values(filepaths, fields):
+    """yields the values of fields from every row of the csv files"""
+    for filepath in filepaths:
+        with open(filepath, 'r', newline='') as csv_in:
+            for row in DictReader(csv_in):
+                for field in fields:
+                    value = row.get(field)
+                    if value:
+                        yield value
+
+
+def main(args):
+    with Dictionary(args.dictionary) as dictionary:
+        counted = dictionary.train(
+            field_values(args.input_files, args.field or ['Summary']),
+            chunk_size=args.chunk_size)
+        stderr.write('{} words counted, {} scanned in total\n'.format(
+            counted, dictionary.words_scanned))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='Train the dictionary on the words of csv fields')
+    parser.add_argument(
+        '-d', '--dictionary',
+        default='aircraft.sqlite',
+        help="dictionary to add the words to")
+    parser.add_argument(
+        '-f', '--field',
+        action='append',
+        help="field to read words from, can be repeated (default Summary)")
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=10000,
+        help="words counted between writes to the dictionary")
+    parser.add_argument(
+        'input_files',
+        nargs='+',
+        help="csv files to train on")
+    main(parser.parse_args())
@@ -0,0 +1,116 @@
+class Trie(object):
+    """Prefix tree of words stored as nested dicts.  search() walks it with
+    one row of the edit distance table per trie level, so a branch is dropped
+    as soon as no word below it can be within the maximum distance."""
+
+    # key marking the end of a word, characters are never empty strings
+    END = ''
+
+    def __init__(self, words=()):
+        self.root = {}
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, word):
+        """returns True if word wasn't in the trie yet"""
+        node = self.root
+        for c in word:
+            node = node.setdefault(c, {})
+        if self.END in node:
+            return False
+        node[self.END] = word
+        self.size += 1
+        return True
+
+    def find_node(self, prefix):
+        node = self.root
+        for c in prefix:
+            node = node.get(c)
+            if node is None:
+                return None
+        return node
+
+    def __contains__(self, word):
+        node = self.find_node(word)
+        return node is not None and self.END in node
+
+    def has_prefix(self, prefix):
+        """True if some word starts with prefix"""
+        return self.find_node(prefix) is not None
+
+    def longest_prefix(self, text, separators=' '):
+        """Returns the longest word that text starts with and that is followed
+        in text by one of separators or by nothing, or None, in one walk down
+        the trie"""
+        node = self.root
+        longest = None
+        for c in text:
+            if self.END in node and c in separators:
+                longest = node[self.END]
+            node = node.get(c)
+            if node is None:
+                return longest
+        return node.get(self.END, longest)
+
+    def search(self, word, max_distance):
+        """Returns a list of (word, distance) for every word within
+        max_distance inserts, deletes, replaces and adjacent transposes of
+        word (optimal string alignment distance)"""
+        results = []
+        first_row = list(range(len(word) + 1))
+        for c, child in self.root.items():
+            if c == self.END:
+                continue
+            self.search_node(
+                child, c, None, word, first_row, None, max_distance, results)
+        if self.END in self.root and len(word) <= max_distance:
+            results.append((self.root[self.END], len(word)))
+        return results
+
+    def search_node(
+            self,
+            node,
+            c,
+            previous_c,
+            word,
+            previous_row,
+            before_previous_row,
+            max_distance,
+            results):
+        row = [previous_row[0] + 1]
+        for j in range(1, len(word) + 1):
+            cost = 0 if word[j-1] == c else 1
+            distance = min(
+                row[j-1] + 1,
+                previous_row[j] + 1,
+                previous_row[j-1] + cost)
+            if before_previous_row is not None and j > 1 \
+                    and word[j-1] == previous_c and word[j-2] == c:
+                distance = min(distance, before_previous_row[j-2] + 1)
+            row.append(distance)
+
+        if row[-1] <= max_distance and self.END in node:
+            results.append((node[self.END], row[-1]))
+
+        # Deeper rows never have entries below this row's minimum (the
+        # transposition step adds 1 to an entry of the previous row, which is
+        # at most 1 below it), so once every entry is over max_distance
+        # nothing further down can match
+        if min(row) > max_distance:
+            return
+        for next_c, child in node.items():
+            if next_c == self.END:
+                continue
+            self.search_node(
+                child,
+                next_c,
+                c,
+                word,
+                row,
+                previous_row,
+                max_distance,
+                results)